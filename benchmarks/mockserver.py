@@ -0,0 +1,331 @@
+#!/usr/bin/python
+"""
+mockserver.py
+
+A local stand-in for the toggl v8 API, serving the endpoints pytoggl uses
+from an in-memory dataset with configurable size and latency. Used by the
+benchmarks, and handy for trying the CLI without a toggl account:
+
+    python benchmarks/mockserver.py --entries 5000 --latency 0.05
+
+then set api_url = http://127.0.0.1:PORT/api/v8 in the [options] section
+of ~/.togglrc.
+"""
+
+import BaseHTTPServer
+import datetime
+import json
+import optparse
+import random
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+import _strptime # imported up front: importing it lazily from several threads fails
+
+WORKSPACE_ID = 1
+USER_ID = 1
+
+#----------------------------------------------------------------------------
+# Dataset
+#----------------------------------------------------------------------------
+class Dataset(object):
+    """
+    The clients, projects and time entries served by MockServer.
+    """
+
+    def __init__(self, entries=1000, days=30, projects=50, clients=10, seed=0):
+        """
+        * entries(int) is the number of completed time entries, spread
+          evenly over the last days(int) days.
+        * projects(int) and clients(int) are the number of each to create.
+        * seed(int) makes the generated data repeatable.
+        """
+        rand = random.Random(seed)
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.clients = [{'id': self._new_id(), 'wid': WORKSPACE_ID, 'name': 'Client %d' % i}
+                        for i in range(clients)]
+        self.projects = []
+        for i in range(projects):
+            project = {'id': self._new_id(), 'wid': WORKSPACE_ID, 'name': 'Project %d' % i}
+            if self.clients and i % 2 == 0:
+                project['cid'] = rand.choice(self.clients)['id']
+            self.projects.append(project)
+
+        self.entries = {}
+        now = time.time()
+        step = days * 86400.0 / max(entries, 1)
+        for i in range(entries):
+            start = now - days * 86400 + i * step
+            entry = {
+                'id': self._new_id(),
+                'wid': WORKSPACE_ID,
+                'uid': USER_ID,
+                'description': 'Task %d' % rand.randint(0, max(entries // 10, 1)),
+                'start': iso(start),
+                'stop': iso(start + step / 2),
+                'duration': int(step / 2),
+                'tags': rand.sample(['a', 'b', 'c', 'd'], rand.randint(0, 2)),
+                'at': iso(now),
+            }
+            if self.projects:
+                entry['pid'] = rand.choice(self.projects)['id']
+            self.entries[entry['id']] = entry
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    # The server answers requests on several threads, so entries are only
+    # read or changed while holding self.lock, and copies are returned.
+
+    def add(self, entry):
+        """
+        Stores a new entry dictionary and returns a copy with its id set.
+        """
+        with self.lock:
+            entry['id'] = self._new_id()
+            entry['at'] = iso(time.time())
+            self.entries[entry['id']] = entry
+            return dict(entry)
+
+    def current(self):
+        """
+        Returns the running entry, or None.
+        """
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.get('duration', 0) < 0:
+                    return dict(entry)
+        return None
+
+    def delete(self, ids):
+        """
+        Deletes the entries with the given ids. Returns False, deleting
+        nothing, if any of them doesn't exist.
+        """
+        with self.lock:
+            if any(i not in self.entries for i in ids):
+                return False
+            for i in ids:
+                del self.entries[i]
+        return True
+
+    def get(self, ids):
+        """
+        Returns the list of entries with the given ids, or None if any of
+        them doesn't exist.
+        """
+        with self.lock:
+            if any(i not in self.entries for i in ids):
+                return None
+            return [dict(self.entries[i]) for i in ids]
+
+    def in_range(self, start_date, end_date, limit=1000):
+        """
+        Returns up to limit entries that started between the given ISO 8601
+        strings, in order of start time.
+        """
+        start, end = parse_iso(start_date), parse_iso(end_date)
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()
+                       if start <= parse_iso(entry['start']) <= end]
+        entries.sort(key=lambda entry: entry['start'])
+        return entries[:limit]
+
+    def update(self, ids, fields):
+        """
+        Applies fields to the entries with the given ids, as update_entry()
+        does. Returns the updated entries, or None, changing nothing, if
+        any of them doesn't exist.
+        """
+        with self.lock:
+            if any(i not in self.entries for i in ids):
+                return None
+            for i in ids:
+                update_entry(self.entries[i], fields)
+            return [dict(self.entries[i]) for i in ids]
+
+#----------------------------------------------------------------------------
+# MockServer
+#----------------------------------------------------------------------------
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A threaded HTTP server answering toggl v8 API requests from a Dataset.
+    Properties:
+        url - the API base URL to use in place of pytoggl.toggl.TOGGL_URL.
+        requests - number of requests served.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, dataset=None, latency=0.0, port=0):
+        """
+        * dataset is the Dataset to serve. Defaults to Dataset().
+        * latency(float) is the number of seconds to wait before answering
+          each request.
+        * port(int) is the port to listen on; 0 picks a free one.
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.dataset = dataset or Dataset()
+        self.latency = latency
+        self.requests = 0
+        self.url = 'http://127.0.0.1:%d/api/v8' % self.server_address[1]
+
+    def start(self):
+        """
+        Serves requests in a background thread. Returns self.
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+#----------------------------------------------------------------------------
+# Handler
+#----------------------------------------------------------------------------
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Routes requests to the endpoints pytoggl uses.
+    """
+
+    protocol_version = 'HTTP/1.1' # keep-alive, like toggl
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _route(self, method):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlparse.urlparse(self.path)
+        query = dict((k, v[0]) for k, v in urlparse.parse_qs(url.query).items())
+        path = re.sub(r'^/api/v8', '', url.path)
+        body = self._body()
+        dataset = server.dataset
+
+        if method == 'GET' and path == '/me':
+            return self._send({'since': 0, 'data': {
+                'id': USER_ID, 'default_wid': WORKSPACE_ID, 'fullname': 'Mock User'}})
+        if method == 'GET' and path == '/clients':
+            return self._send(dataset.clients)
+        if method == 'GET' and path == '/workspaces/%d/projects' % WORKSPACE_ID:
+            return self._send(dataset.projects)
+        if method == 'GET' and path == '/time_entries/current':
+            return self._send({'data': dataset.current()})
+        if method == 'GET' and path == '/time_entries':
+            now = iso(time.time())
+            return self._send(dataset.in_range(query.get('start_date', iso(time.time() - 9 * 86400)),
+                                               query.get('end_date', now)))
+        if method == 'POST' and path in ('/time_entries', '/time_entries/start'):
+            entry = body['time_entry']
+            if path == '/time_entries/start':
+                entry['start'] = iso(time.time())
+                entry['duration'] = -int(time.time())
+            return self._send({'data': dataset.add(entry)})
+
+        match = re.match(r'^/time_entries/([\d,]+)$', path)
+        if match:
+            ids = [int(i) for i in match.group(1).split(',')]
+            if len(ids) > 1 and method != 'PUT':
+                # Only updates take several ids, as with toggl.
+                return self._send({'error': 'not found'}, 404)
+            if method == 'GET':
+                entries = dataset.get(ids)
+                if entries is not None:
+                    return self._send({'data': entries[0]})
+            elif method == 'PUT':
+                updated = dataset.update(ids, body['time_entry'])
+                if updated is not None:
+                    return self._send({'data': updated if len(ids) > 1 else updated[0]})
+            elif method == 'DELETE':
+                if dataset.delete(ids):
+                    return self._send([])
+
+        self._send({'error': 'not found'}, 404)
+
+    def _send(self, obj, status=200):
+        body = json.dumps(obj)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def update_entry(entry, fields):
+    """
+    Applies an update to an entry dictionary as toggl does: with a
+    tag_action of 'add' or 'remove', the given tags are added to or removed
+    from the entry's tags instead of replacing them.
+    """
+    fields = dict(fields)
+    tag_action = fields.pop('tag_action', None)
+    if tag_action in ('add', 'remove') and 'tags' in fields:
+        tags = entry.get('tags') or []
+        if tag_action == 'add':
+            fields['tags'] = tags + [tag for tag in fields['tags'] if tag not in tags]
+        else:
+            fields['tags'] = [tag for tag in tags if tag not in fields['tags']]
+    entry.update(fields)
+
+def iso(epoch):
+    return datetime.datetime.utcfromtimestamp(int(epoch)).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+def parse_iso(iso_str):
+    # Only the UTC timestamps this server produces, and the offset-aware
+    # ones pytoggl sends, need to be understood; compare them as UTC.
+    match = re.match(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(?:Z|([+-])(\d\d):?(\d\d))?$', iso_str)
+    value = datetime.datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S')
+    if match.group(2):
+        offset = datetime.timedelta(hours=int(match.group(3)), minutes=int(match.group(4)))
+        value = value - offset if match.group(2) == '+' else value + offset
+    return value
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [OPTIONS]")
+    parser.add_option("-p", "--port", type="int", dest="port", default=8000)
+    parser.add_option("-n", "--entries", type="int", dest="entries", default=1000)
+    parser.add_option("--days", type="int", dest="days", default=30)
+    parser.add_option("--projects", type="int", dest="projects", default=50)
+    parser.add_option("-l", "--latency", type="float", dest="latency", default=0.0,
+                      help="seconds to wait before each response")
+    options, _ = parser.parse_args()
+
+    dataset = Dataset(entries=options.entries, days=options.days, projects=options.projects)
+    server = MockServer(dataset, latency=options.latency, port=options.port)
+    print "Serving %d entries on %s" % (options.entries, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
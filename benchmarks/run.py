@@ -0,0 +1,233 @@
+#!/usr/bin/python
+"""
+run.py
+
+pytoggl benchmarks, run against a local MockServer so results don't
+depend on the network or on a toggl account:
+
+    python benchmarks/run.py                       # everything
+    python benchmarks/run.py reload find_by_name   # selected benchmarks
+    python benchmarks/run.py --entries 20000 --latency 0.05
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json
+
+Each benchmark is run once to warm up and then --repeat times, and the best
+and median times are reported. With --compare, a benchmark whose median
+is more than --threshold slower than in the saved results is reported
+as a regression and the exit status is 1.
+
+The benchmarks use a temporary HOME with their own ~/.togglrc and cache,
+so they never touch your configuration or your toggl account.
+"""
+
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mockserver import Dataset, MockServer
+
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.2 # allowed slowdown before --compare fails, as a fraction
+
+TOGGLRC = """[auth]
+api_token = benchmark
+
+[options]
+timezone = UTC
+time_format = %%I:%%M%%p
+prefer_token = true
+rate_limit = 0
+cache_dir = %(cache_dir)s
+api_url = %(api_url)s
+"""
+
+BENCHMARKS = []
+
+def benchmark(fn):
+    """
+    Registers fn(context) as a benchmark. Its name is fn's name without the
+    'bench_' prefix.
+    """
+    BENCHMARKS.append(fn)
+    return fn
+
+#----------------------------------------------------------------------------
+# Benchmarks
+#----------------------------------------------------------------------------
+@benchmark
+def bench_reload(context):
+    from pytoggl.toggl import TimeEntryList
+    TimeEntryList().reload()
+
+@benchmark
+def bench_iter_time_entries(context):
+    from pytoggl.toggl import iter_time_entries
+    from pytoggl.utility import DateAndTime
+    dt = DateAndTime()
+    start = dt.now() - context.history
+    for entry in iter_time_entries(start, dt.now(), compact=True):
+        pass
+
+@benchmark
+def bench_find_by_name(context):
+    from pytoggl.toggl import ProjectList
+    projects = ProjectList()
+    for i in range(1000):
+        projects.find_by_name('Project %d' % (i % context.projects))
+
+@benchmark
+def bench_entry_list_str(context):
+    from pytoggl.toggl import TimeEntryList
+    str(TimeEntryList())
+
+@benchmark
+def bench_bulk_add(context):
+    from pytoggl.bulk import import_entries
+    from pytoggl.utility import DateAndTime
+    start = DateAndTime().now()
+    rows = [{'description': 'Bulk %d' % i,
+             'start': start.isoformat(),
+             'duration': 60,
+             'project': 'Project %d' % (i % context.projects)}
+            for i in range(context.bulk_rows)]
+    for result in import_entries(rows, workers=8):
+        if not result.ok:
+            raise RuntimeError(str(result))
+
+@benchmark
+def bench_cli_help(context):
+    context.run_cli('--help')
+
+@benchmark
+def bench_cli_ls(context):
+    context.run_cli('ls')
+
+#----------------------------------------------------------------------------
+# Context
+#----------------------------------------------------------------------------
+class Context(object):
+    """
+    The mock server and temporary home directory shared by the benchmarks.
+    """
+
+    def __init__(self, options):
+        self.projects = options.projects
+        self.bulk_rows = options.bulk_rows
+        import datetime
+        self.history = datetime.timedelta(days=options.days)
+
+        dataset = Dataset(entries=options.entries, days=options.days, projects=options.projects)
+        self.server = MockServer(dataset, latency=options.latency).start()
+
+        self.home = tempfile.mkdtemp(prefix='pytoggl-bench-')
+        with open(os.path.join(self.home, '.togglrc'), 'w') as f:
+            f.write(TOGGLRC % {'cache_dir': os.path.join(self.home, 'cache'),
+                               'api_url': self.server.url})
+        os.environ['HOME'] = self.home
+
+    def close(self):
+        from pytoggl.utility import DefaultTransport
+        if DefaultTransport.instance is not None:
+            DefaultTransport().close() # drop keep-alive connections first
+        self.server.stop()
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def reset(self):
+        """
+        Discards the process-wide pytoggl singletons, so each run starts as
+        a new process would, apart from warm imports.
+        """
+        from pytoggl.toggl import ClientList, ProjectList, TimeEntryList, User
+        for cls in (ClientList, ProjectList, TimeEntryList, User):
+            cls.reset_instance()
+
+    def run_cli(self, *args):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, os.path.join(ROOT, 'toggl-cli.py')] + list(args),
+                                  stdout=devnull, stderr=devnull, env=env)
+
+#----------------------------------------------------------------------------
+# main
+#----------------------------------------------------------------------------
+def run(fn, context, repeat):
+    """
+    Returns the sorted list of times, in seconds, of repeat runs of fn.
+    """
+    context.reset()
+    fn(context) # warm-up
+    times = []
+    for _ in range(repeat):
+        context.reset()
+        start = time.time()
+        fn(context)
+        times.append(time.time() - start)
+    return sorted(times)
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [OPTIONS] [BENCHMARK ...]")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=DEFAULT_REPEAT,
+                      help="timed runs per benchmark (default %d)" % DEFAULT_REPEAT)
+    parser.add_option("-n", "--entries", type="int", dest="entries", default=2000,
+                      help="time entries in the mock dataset")
+    parser.add_option("--days", type="int", dest="days", default=30,
+                      help="days the entries are spread over")
+    parser.add_option("--projects", type="int", dest="projects", default=50,
+                      help="projects in the mock dataset")
+    parser.add_option("--bulk-rows", type="int", dest="bulk_rows", default=200,
+                      help="entries added by bulk_add")
+    parser.add_option("-l", "--latency", type="float", dest="latency", default=0.0,
+                      help="seconds the mock server waits before each response")
+    parser.add_option("--save", dest="save", metavar="FILE",
+                      help="write the results to FILE")
+    parser.add_option("--compare", dest="compare", metavar="FILE",
+                      help="compare the results with those saved in FILE")
+    parser.add_option("--threshold", type="float", dest="threshold", default=DEFAULT_THRESHOLD,
+                      help="slowdown counted as a regression (default %g)" % DEFAULT_THRESHOLD)
+    options, names = parser.parse_args()
+
+    selected = [fn for fn in BENCHMARKS
+                if not names or fn.__name__[len('bench_'):] in names]
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+    context = Context(options)
+    results = {}
+    regressions = []
+    try:
+        for fn in selected:
+            name = fn.__name__[len('bench_'):]
+            times = run(fn, context, options.repeat)
+            median = times[len(times) // 2]
+            results[name] = {'best': times[0], 'median': median}
+            line = "%-20s best %8.1fms  median %8.1fms" % (name, times[0] * 1000, median * 1000)
+            if name in baseline:
+                change = median / baseline[name]['median'] - 1
+                line += "  %+6.1f%%" % (change * 100)
+                if change > options.threshold:
+                    regressions.append(name)
+                    line += "  REGRESSION"
+            print line
+            sys.stdout.flush()
+    finally:
+        context.close()
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'options': vars(options), 'results': results}, f, indent=2)
+    if regressions:
+        print "Regressions: %s" % ', '.join(regressions)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+"""
+startup.py
+
+Measures the cold-start time of toggl-cli.py. Each action is run in a fresh
+interpreter several times, and the overhead over a bare interpreter start
+is compared against a budget:
+
+    python benchmarks/startup.py                # just --help
+    python benchmarks/startup.py --skip-help now ls
+    python benchmarks/startup.py --imports      # cost of individual imports
+
+Actions other than --help talk to toggl (or to a running daemon), so they
+need a configured ~/.togglrc. Avoid timing actions that change data, such
+as start and stop. Exits with status 1 if any action is over budget.
+"""
+
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'toggl-cli.py')
+
+# Seconds a toggl-cli.py action may take on top of the interpreter's own
+# startup time.
+DEFAULT_BUDGET = 0.1
+DEFAULT_RUNS = 10
+
+# Modules whose import cost --imports reports.
+IMPORTS = ('requests', 'pytz', 'iso8601', 'pytoggl.utility', 'pytoggl.toggl', 'pytoggl.daemon')
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def time_command(command, runs):
+    """
+    Runs command (a list of arguments) runs times and returns the sorted
+    list of wall-clock times, in seconds.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    with open(os.devnull, 'w') as devnull:
+        times = []
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(command, stdout=devnull, stderr=devnull, env=env)
+            times.append(time.time() - start)
+    return sorted(times)
+
+def median(times):
+    return times[len(times) // 2]
+
+def report(name, times, baseline=None):
+    line = "%-24s best %6.1fms  median %6.1fms" % \
+        (name, times[0] * 1000, median(times) * 1000)
+    if baseline is not None:
+        line += "  overhead %6.1fms" % ((median(times) - baseline) * 1000)
+    print line
+
+#----------------------------------------------------------------------------
+# main
+#----------------------------------------------------------------------------
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [OPTIONS] [ACTION ...]")
+    parser.add_option("-n", "--runs", type="int", dest="runs", default=DEFAULT_RUNS,
+                      help="runs per action (default %d)" % DEFAULT_RUNS)
+    parser.add_option("-b", "--budget", type="float", dest="budget", default=DEFAULT_BUDGET,
+                      help="allowed overhead per action, in seconds (default %g)" % DEFAULT_BUDGET)
+    parser.add_option("--skip-help", action="store_true", dest="skip_help", default=False,
+                      help="skip --help when actions are given")
+    parser.add_option("--imports", action="store_true", dest="imports", default=False,
+                      help="also time importing individual modules")
+    options, actions = parser.parse_args()
+
+    baseline = median(time_command([sys.executable, '-c', 'pass'], options.runs))
+    print "%-24s median %6.1fms" % ('python -c pass', baseline * 1000)
+
+    if options.imports:
+        for module in IMPORTS:
+            times = time_command([sys.executable, '-c', 'import ' + module], options.runs)
+            report('import ' + module, times, baseline)
+
+    over_budget = []
+    commands = [] if (actions and options.skip_help) else [['--help']]
+    commands += [action.split() for action in actions]
+    for args in commands:
+        times = time_command([sys.executable, CLI] + args, options.runs)
+        report(' '.join(args), times, baseline)
+        if median(times) - baseline > options.budget:
+            over_budget.append(' '.join(args))
+
+    if over_budget:
+        print "Over the %gms budget: %s" % (options.budget * 1000, ', '.join(over_budget))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+aggregate.py
+
+Columnar time entry aggregation for reports over large numbers of entries.
+
+Entries are loaded once into compact typed arrays, after which totals can
+be grouped by day, week, project, client, user or tag. If NumPy is
+installed the group-bys are vectorized; otherwise a pure Python backend
+is used. to_dataframe() is available when pandas is installed.
+"""
+
+import array
+import datetime
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .toggl import DefaultClient
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+NO_ID = 0 # stored in the pid and uid columns when an entry has none
+
+#----------------------------------------------------------------------------
+# EntryColumns
+#----------------------------------------------------------------------------
+class EntryColumns(object):
+    """
+    Time entries stored column by column.
+    Properties:
+        start - array of start times, in seconds since the epoch.
+        duration - array of normalized durations, in seconds.
+        day - array of local (per the configured timezone) day numbers,
+          counted in days since 1970-01-01.
+        pid - array of project ids, or NO_ID.
+        uid - array of user ids, or NO_ID.
+        tags - list of tag tuples.
+    """
+
+    GROUPS = ('day', 'week', 'project', 'client', 'user', 'tag')
+
+    def __init__(self, now=None, client=None):
+        """
+        * now(float) is the time, in seconds since the epoch, used to compute
+          the duration of running entries. Defaults to the current time.
+        * client is an optional TogglClient whose timezone and projects are
+          used; by default the account configured in ~/.togglrc is used.
+        """
+        self.client = client or DefaultClient()
+        self.now = now if now is not None else time.time()
+        self.start = array.array('d')
+        self.duration = array.array('d')
+        self.day = array.array('l')
+        self.pid = array.array('l')
+        self.uid = array.array('l')
+        self.tags = []
+        self._utc_offsets = {}
+
+    @classmethod
+    def from_entries(cls, entries, now=None, client=None):
+        """
+        Returns new EntryColumns holding the given iterable of TimeEntry or
+        CompactTimeEntry objects.
+        """
+        columns = cls(now, client)
+        columns.extend(entries)
+        return columns
+
+    def __len__(self):
+        return len(self.start)
+
+    def append(self, entry):
+        """
+        Adds a single TimeEntry or CompactTimeEntry.
+        """
+        start = self.client.date_and_time().parse_iso_epoch(entry.get('start'))
+        duration = int(entry.get('duration') or 0)
+        if duration < 0:
+            duration = self.now + duration
+
+        self.start.append(start)
+        self.duration.append(duration)
+        self.day.append(int((start + self._utc_offset(start)) // 86400))
+        self.pid.append(entry.get('pid') or NO_ID)
+        self.uid.append(entry.get('uid') or NO_ID)
+        self.tags.append(tuple(entry.get('tags') or ()))
+
+    def extend(self, entries):
+        """
+        Adds every entry in the given iterable.
+        """
+        for entry in entries:
+            self.append(entry)
+
+    def to_dataframe(self):
+        """
+        Returns the columns as a pandas DataFrame. Raises ImportError if
+        pandas isn't installed.
+        """
+        import pandas
+        return pandas.DataFrame({
+            'start': pandas.to_datetime(list(self.start), unit='s', utc=True),
+            'duration': list(self.duration),
+            'day': [_day_str(day) for day in self.day],
+            'pid': list(self.pid),
+            'uid': list(self.uid),
+            'tags': self.tags,
+        })
+
+    def totals(self, by='day', backend=None):
+        """
+        Returns a dictionary mapping group keys to total seconds. by is one
+        of GROUPS:
+            day - 'YYYY-MM-DD' local date.
+            week - 'YYYY-MM-DD' local date of the Monday starting the week.
+            project - project id, or None.
+            client - client id, or None.
+            user - user id, or None.
+            tag - tag name. Entries with several tags count towards each.
+        backend is 'numpy' or 'python'; by default NumPy is used when it
+        is installed.
+        """
+        if by not in self.GROUPS:
+            raise ValueError("Cannot group time entries by '%s'." % by)
+        if backend is None:
+            backend = 'numpy' if numpy is not None else 'python'
+
+        if by == 'tag':
+            keys, durations = self._tag_column()
+        else:
+            keys, durations = self._key_column(by), self.duration
+
+        if backend == 'numpy':
+            sums = _sum_numpy(keys, durations)
+        elif backend == 'python':
+            sums = _sum_python(keys, durations)
+        else:
+            raise ValueError("Unknown aggregation backend '%s'." % backend)
+
+        return dict((self._label(by, key), total) for key, total in sums.iteritems())
+
+    def _key_column(self, by):
+        if by == 'day':
+            return self.day
+        if by == 'week':
+            # 1970-01-01 was a Thursday, so Mondays fall on day numbers
+            # congruent to 4 (mod 7).
+            return array.array('l', (day - (day - 4) % 7 for day in self.day))
+        if by == 'project':
+            return self.pid
+        if by == 'user':
+            return self.uid
+        if by == 'client':
+            client_ids = {}
+            projects = self.client.projects()
+            for pid in set(self.pid):
+                project = projects.find_by_id(pid) if pid != NO_ID else None
+                client_ids[pid] = (project or {}).get('cid') or NO_ID
+            return array.array('l', (client_ids[pid] for pid in self.pid))
+
+    def _label(self, by, key):
+        if by in ('day', 'week'):
+            return _day_str(key)
+        if by == 'tag':
+            return key
+        return key if key != NO_ID else None
+
+    def _tag_column(self):
+        keys = []
+        durations = array.array('d')
+        for tags, duration in zip(self.tags, self.duration):
+            for tag in tags:
+                keys.append(tag)
+                durations.append(duration)
+        return keys, durations
+
+    def _utc_offset(self, epoch):
+        # UTC offsets only change on hour boundaries (in practice), so
+        # memoize them per hour instead of asking pytz for every entry.
+        hour = int(epoch // 3600)
+        if hour not in self._utc_offsets:
+            tz = self.client.date_and_time().tz
+            utc_time = datetime.datetime.utcfromtimestamp(hour * 3600)
+            local_time = tz.fromutc(utc_time.replace(tzinfo=tz))
+            self._utc_offsets[hour] = local_time.utcoffset().total_seconds()
+        return self._utc_offsets[hour]
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def _day_str(day):
+    return datetime.date.fromordinal(day + EPOCH_ORDINAL).strftime("%Y-%m-%d")
+
+def _sum_numpy(keys, durations):
+    if isinstance(keys, array.array):
+        keys = numpy.frombuffer(keys, dtype=keys.typecode)
+    else:
+        keys = numpy.asarray(keys, dtype=object)
+    durations = numpy.frombuffer(durations, dtype='d')
+    if not len(keys):
+        return {}
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    sums = numpy.bincount(inverse, weights=durations)
+    return dict(zip(unique.tolist(), sums.tolist()))
+
+def _sum_python(keys, durations):
+    sums = {}
+    for key, duration in zip(keys, durations):
+        sums[key] = sums.get(key, 0.0) + duration
+    return sums
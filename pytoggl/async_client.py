@@ -0,0 +1,181 @@
+"""
+async_client.py
+
+Concurrent access to the toggl API. Every AsyncTogglClient call returns
+immediately with a Future; up to max_concurrency requests are in flight at
+once over a shared pooled Transport. Starting and stopping entries goes
+through the client's journal instead, as with TimeEntry, so the local
+running entry state stays right.
+"""
+
+import json
+import urllib
+
+from .toggl import DefaultClient, TimeEntry
+from .utility import Transport, WorkerPool
+
+#----------------------------------------------------------------------------
+# AsyncTogglClient
+#----------------------------------------------------------------------------
+class AsyncTogglClient(object):
+    """
+    Issues toggl requests concurrently. Each public method returns a
+    pytoggl.utility.Future; call result() on it to wait for the value.
+
+        client = AsyncTogglClient(max_concurrency=16)
+        futures = [client.add_entry(entry) for entry in entries]
+        added = client.gather(futures)
+    """
+
+    def __init__(self, max_concurrency=8, auth=None, transport=None, client=None):
+        """
+        * max_concurrency(int) is the maximum number of requests in flight.
+        * auth is an optional requests auth object. Defaults to the
+          credentials in ~/.togglrc.
+        * transport is an optional Transport to send requests through. By
+          default the client's transport is used, or a new one is created,
+          sized to max_concurrency.
+        * client is an optional TogglClient whose account, API URL and
+          timezone are used; by default the account configured in
+          ~/.togglrc is used.
+        """
+        self.client = client or DefaultClient()
+        if transport is None:
+            transport = getattr(client, 'transport', None)
+        if transport is None:
+            transport = Transport(auth=auth, pool_size=max_concurrency)
+        self.transport = transport
+        self.pool = WorkerPool(max_concurrency)
+        self._default_wid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_entry(self, entry):
+        """
+        Adds the given TimeEntry as a completed entry. The future's result
+        is a new TimeEntry holding the data toggl returned.
+        """
+        entry.validate()
+        return self._submit(self._save_entry, "%s/time_entries" % self.client.url, entry)
+
+    def clients(self):
+        """
+        Fetches the list of client objects.
+        """
+        return self._submit(self._get, "%s/clients" % self.client.url)
+
+    def close(self):
+        """
+        Waits for outstanding requests and closes all pooled connections.
+        """
+        self.pool.shutdown()
+        self.transport.close()
+
+    def delete(self, entry):
+        """
+        Deletes the given TimeEntry from the server.
+        """
+        if not entry.has('id'):
+            raise Exception("Time entry must have an id to be deleted.")
+        url = "%s/time_entries/%s" % (self.client.url, entry.get('id'))
+        return self._submit(self._delete, url, entry)
+
+    def gather(self, futures):
+        """
+        Waits for all the given futures and returns their results, in order.
+        """
+        return [future.result() for future in futures]
+
+    def projects(self, wid=None):
+        """
+        Fetches the list of project objects in the given workspace, or in
+        the user's default workspace.
+        """
+        return self._submit(self._get_projects, wid)
+
+    def start(self, entry):
+        """
+        Starts the given TimeEntry now. The future's result is a new
+        TimeEntry holding the running entry.
+
+        Like TimeEntry.start(), this goes through the client's journal and
+        updates its running entry state.
+        """
+        entry.set('start', None)
+        return self._submit(self._change_entry, entry, TimeEntry.start)
+
+    def stop(self, entry, stop_time=None):
+        """
+        Stops the given running TimeEntry at stop_time, or now. Like
+        TimeEntry.stop(), this goes through the client's journal and
+        updates its running entry state.
+        """
+        entry.validate()
+        if int(entry.get('duration')) >= 0:
+            raise Exception("toggl: time entry is not currently running.")
+        if not entry.has('id') and not entry.has('guid'):
+            raise Exception("toggl: time entry must have an id.")
+        return self._submit(self._change_entry, entry, TimeEntry.stop, stop_time)
+
+    def time_entries(self, start_time=None, end_time=None):
+        """
+        Fetches the time entries between the given localized datetimes,
+        defaulting to 00:00:00 yesterday through 23:59:59 today. The future's
+        result is a list of TimeEntry objects sorted by start time.
+        """
+        if start_time is None:
+            start_time = self.client.date_and_time().start_of_yesterday()
+        if end_time is None:
+            end_time = self.client.date_and_time().last_minute_today()
+        url = "%s/time_entries?start_date=%s&end_date=%s" % \
+            (self.client.url, urllib.quote(start_time.isoformat('T')),
+            urllib.quote(end_time.isoformat('T')))
+        return self._submit(self._get_entries, url)
+
+    def user(self):
+        """
+        Fetches the user data dictionary, including 'since'.
+        """
+        return self._submit(self._get_user)
+
+    def _change_entry(self, entry, method, *args):
+        entry.client = self.client
+        method(entry, *args)
+        return TimeEntry(data_dict=dict(entry.data), client=self.client)
+
+    def _delete(self, url, entry):
+        self.transport.request(url, 'delete')
+        self.client.running_state().remove(entry.data)
+
+    def _get(self, url):
+        return json.loads(self.transport.request(url, 'get').text)
+
+    def _get_entries(self, url):
+        entries = [TimeEntry(data_dict=entry, client=self.client) for entry in self._get(url)]
+        entries.sort(key=lambda entry: entry.get('start'))
+        return entries
+
+    def _get_projects(self, wid):
+        if wid is None:
+            if self._default_wid is None:
+                self._default_wid = self._get_user()['default_wid']
+            wid = self._default_wid
+        return self._get("%s/workspaces/%s/projects" % (self.client.url, wid))
+
+    def _get_user(self):
+        result_dict = self._get("%s/me" % self.client.url)
+        data = result_dict['data']
+        data['since'] = result_dict['since']
+        return data
+
+    def _save_entry(self, url, entry, method='post'):
+        r = self.transport.request(url, method, data=entry.json(),
+                                   headers={'content-type': 'application/json'})
+        return TimeEntry(data_dict=json.loads(r.text)['data'], client=self.client)
+
+    def _submit(self, fn, *args):
+        return self.pool.submit(fn, *args)
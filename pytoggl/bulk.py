@@ -0,0 +1,192 @@
+"""
+bulk.py
+
+Bulk import of completed time entries from CSV or JSONL files.
+
+Each row is a dictionary with these keys (CSV files use them as column
+headers):
+    description - required.
+    start       - required ISO 8601 datetime.
+    stop        - ISO 8601 datetime. Either stop or duration is required.
+    duration    - seconds, or [[Hours:]Minutes:]Seconds.
+    project     - optional project name, with or without the '@' prefix.
+    tags        - optional list of tags (comma-separated in CSV files).
+    billable    - optional boolean.
+"""
+
+import collections
+import csv
+import json
+import sys
+
+from .async_client import AsyncTogglClient
+from .toggl import DefaultClient, TimeEntry
+from .utility import Future
+
+#----------------------------------------------------------------------------
+# ImportResult
+#----------------------------------------------------------------------------
+class ImportResult(object):
+    """
+    The outcome of importing a single row.
+    Properties:
+        row_number - 1-based position of the row in the input.
+        row - the row dictionary as read.
+        entry - the TimeEntry toggl returned, or None on failure.
+        error - the exception raised, or None on success.
+    """
+
+    def __init__(self, row_number, row, entry=None, error=None):
+        self.row_number = row_number
+        self.row = row
+        self.entry = entry
+        self.error = error
+
+    @property
+    def ok(self):
+        """
+        True if the row was imported.
+        """
+        return self.error is None
+
+    def __str__(self):
+        """
+        Formats the result as a one-line report.
+        """
+        if self.ok:
+            return "%d: added %s [%s]" % (self.row_number,
+                self.entry.get('description'), self.entry.get('id'))
+        return "%d: failed: %s" % (self.row_number, self.error)
+
+#----------------------------------------------------------------------------
+# Readers
+#----------------------------------------------------------------------------
+def read_csv(fileobj):
+    """
+    Yields one row dictionary per line of the given CSV file. The first
+    line must contain the column names.
+    """
+    for row in csv.DictReader(fileobj):
+        if row.get('tags'):
+            row['tags'] = [tag.strip() for tag in row['tags'].split(',')]
+        yield row
+
+def read_jsonl(fileobj):
+    """
+    Yields one row dictionary per non-blank line of the given JSONL file.
+    """
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line)
+
+def read_rows(fileobj, name=None):
+    """
+    Yields row dictionaries from the given file, choosing the reader by the
+    extension of name (defaulting to fileobj.name). Files ending in .jsonl
+    or .json are read as JSONL, anything else as CSV.
+    """
+    if name is None:
+        name = getattr(fileobj, 'name', '')
+    if name.lower().endswith(('.jsonl', '.json')):
+        return read_jsonl(fileobj)
+    return read_csv(fileobj)
+
+#----------------------------------------------------------------------------
+# entry_from_row
+#----------------------------------------------------------------------------
+def entry_from_row(row, project_ids=None, client=None):
+    """
+    Builds and validates a completed TimeEntry from a row dictionary.
+    project_ids is an optional dictionary used to memoize project name to
+    id lookups across rows. client is an optional TogglClient the entry
+    belongs to. Raises an exception if the row is invalid.
+    """
+    if project_ids is None:
+        project_ids = {}
+    client = client or DefaultClient()
+    dt = client.date_and_time()
+
+    start_time = _parse_time(dt, row, 'start')
+    stop_time = _parse_time(dt, row, 'stop')
+    duration = row.get('duration')
+    if duration in (None, ''):
+        if stop_time is None:
+            raise Exception("toggl: time entries must have a 'stop' or 'duration' property.")
+        duration = int((stop_time - start_time).total_seconds())
+    elif isinstance(duration, basestring):
+        duration = dt.duration_str_to_seconds(duration)
+
+    entry = TimeEntry(
+        description=row.get('description') or None,
+        start_time=start_time,
+        stop_time=stop_time,
+        duration=duration,
+        client=client
+    )
+
+    project_name = row.get('project')
+    if project_name:
+        entry.set('pid', _project_id(client, project_name.lstrip('@'), project_ids))
+    if row.get('tags'):
+        entry.set('tags', list(row['tags']))
+    if row.get('billable') not in (None, ''):
+        entry.set('billable', str(row['billable']).lower() in ('1', 'true', 'yes'))
+
+    entry.validate()
+    return entry
+
+def _parse_time(dt, row, key):
+    if not row.get(key):
+        return None
+    return dt.parse_iso_str(row[key])
+
+def _project_id(client, name, project_ids):
+    if name not in project_ids:
+        project = client.projects().find_by_name(name, strict=True)
+        project_ids[name] = project['id'] if project is not None else None
+    if project_ids[name] is None:
+        raise RuntimeError("Project '%s' not found." % name)
+    return project_ids[name]
+
+#----------------------------------------------------------------------------
+# import_entries
+#----------------------------------------------------------------------------
+def import_entries(rows, workers=8, client=None):
+    """
+    Adds a completed time entry for every row dictionary in rows, and yields
+    an ImportResult per row, in input order.
+
+    rows is consumed lazily and only about `workers` rows are held in memory
+    at once, so arbitrarily large files can be streamed. Project
+    names are resolved once each. Rows are submitted through client (an
+    AsyncTogglClient), or a new client with the given number of workers.
+    """
+    own_client = client is None
+    if own_client:
+        client = AsyncTogglClient(max_concurrency=workers)
+
+    project_ids = {}
+    pending = collections.deque()
+    try:
+        for row_number, row in enumerate(rows, 1):
+            try:
+                future = client.add_entry(entry_from_row(row, project_ids, client.client))
+            except Exception:
+                future = Future()
+                future.set_exception(sys.exc_info())
+            pending.append((row_number, row, future))
+
+            while len(pending) > workers:
+                yield _result(*pending.popleft())
+
+        while pending:
+            yield _result(*pending.popleft())
+    finally:
+        if own_client:
+            client.close()
+
+def _result(row_number, row, future):
+    error = future.exception()
+    if error is not None:
+        return ImportResult(row_number, row, error=error)
+    return ImportResult(row_number, row, entry=future.result())
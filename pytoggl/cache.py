@@ -0,0 +1,276 @@
+"""
+cache.py
+
+Persistent on-disk cache for rarely-changing toggl metadata (the user,
+clients and projects), so each process doesn't have to refetch them.
+
+Cached bodies are stored as one JSON file per URL under
+~/.cache/pytoggl/v<CACHE_VERSION>/<namespace>/, together with the
+response's validators. Once a body is stale it is revalidated with a
+conditional request (If-None-Match / If-Modified-Since), falling back to
+comparing content hashes, and an unchanged body is kept, along with its
+already decoded JSON. The [options] section of ~/.togglrc may set:
+    cache_dir - directory to store the cache in.
+    cache_ttl - seconds a cached body stays fresh (0 disables the cache).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .utility import Config, DefaultTransport, LRUCache, Singleton
+
+CACHE_VERSION = 1
+
+# Decoded JSON bodies, keyed by (url, body hash), reused while a body stays
+# the same.
+DECODED_BODIES = LRUCache(64)
+
+#----------------------------------------------------------------------------
+# MetadataCache
+#----------------------------------------------------------------------------
+class MetadataCache(object):
+    """
+    A file-backed cache of HTTP response bodies, keyed by URL. Entries
+    older than ttl seconds are treated as missing.
+    """
+
+    DEFAULT_TTL = 3600
+
+    def __init__(self, path=None, ttl=None, namespace='default'):
+        """
+        * path(str) is the cache root directory. Defaults to cache_dir from
+          ~/.togglrc, or ~/.cache/pytoggl.
+        * ttl(int) is the number of seconds a body stays fresh. Defaults to
+          cache_ttl from ~/.togglrc, or DEFAULT_TTL.
+        * namespace(str) separates the caches of different accounts.
+        """
+        if path is None:
+            path = cache_root()
+        if ttl is None:
+            ttl = Config().get_default('options', 'cache_ttl', self.DEFAULT_TTL)
+        self.ttl = int(ttl)
+        self.path = os.path.join(os.path.expanduser(path),
+                                 'v%d' % CACHE_VERSION, namespace)
+
+    def get(self, key):
+        """
+        Returns the cached body for key, or None if it is missing or stale.
+        """
+        record = self._read(key)
+        if record is None or not self.is_fresh(record):
+            return None
+        return record['body']
+
+    def get_record(self, key):
+        """
+        Returns the cached record for key however old it is, or None. A
+        record is a dictionary holding the 'body', when it was 'stored_at',
+        and the validators 'etag', 'last_modified' and 'hash' (of the
+        body).
+        """
+        return self._read(key)
+
+    def invalidate(self, key=None):
+        """
+        Removes the cached body for key, or every cached body if key is None.
+        """
+        if key is not None:
+            paths = [self._file(key)]
+        elif os.path.isdir(self.path):
+            paths = [os.path.join(self.path, name) for name in os.listdir(self.path)]
+        else:
+            paths = []
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def is_fresh(self, record):
+        """
+        Returns True if the given record is younger than the ttl.
+        """
+        return time.time() - record['stored_at'] < self.ttl
+
+    def set(self, key, body, etag=None, last_modified=None):
+        """
+        Stores body, and the validators of the response it came from, as the
+        cached value for key. Returns the new record.
+        """
+        record = {
+            'key': key,
+            'stored_at': time.time(),
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'hash': body_hash(body),
+        }
+        if self.ttl > 0:
+            write_json_atomic(self._file(key), record)
+        return record
+
+    def touch(self, record):
+        """
+        Marks the given record as fresh again, after it was revalidated.
+        """
+        record['stored_at'] = time.time()
+        if self.ttl > 0:
+            write_json_atomic(self._file(record['key']), record)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest() + '.json')
+
+    def _read(self, key):
+        if self.ttl <= 0:
+            return None
+        try:
+            with open(self._file(key)) as f:
+                record = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if record.get('key') != key:
+            return None
+        return record
+
+#----------------------------------------------------------------------------
+# DefaultCache
+#----------------------------------------------------------------------------
+class DefaultCache(MetadataCache):
+    """
+    Singleton MetadataCache for the account configured in ~/.togglrc.
+    """
+
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        super(DefaultCache, self).__init__(namespace=default_namespace())
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def account_file(kind, suffix='.json', root=None):
+    """
+    Returns the path of the per-account file of the given kind (e.g. 'sync')
+    for the account configured in ~/.togglrc, under root (cache_root() by
+    default).
+    """
+    return os.path.join(root or cache_root(), kind, default_namespace() + suffix)
+
+def auth_namespace(auth):
+    """
+    Returns a cache namespace identifying the account behind the given
+    requests auth object, without exposing its credentials.
+    """
+    return username_namespace(getattr(auth, 'username', ''))
+
+def body_hash(body):
+    """
+    Returns a hash of the given response body, used to detect unchanged
+    bodies when the server sends no validators.
+    """
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    return hashlib.sha1(body or '').hexdigest()
+
+def cached_get(url, cache=None, transport=None, refresh=False):
+    """
+    Returns the body of a GET request to url, served from cache (the
+    DefaultCache if not given) when fresh, and revalidated or stored there
+    otherwise. transport is an optional Transport to fetch through instead
+    of the DefaultTransport. If refresh is True the cached body is
+    revalidated even if it is fresh.
+    """
+    return _cached_record(url, cache, transport, refresh)['body']
+
+def cached_get_json(url, cache=None, transport=None, refresh=False):
+    """
+    Like cached_get(), but returns the decoded JSON body. While the body is
+    unchanged the same decoded value is returned again, so callers must not
+    modify it.
+    """
+    record = _cached_record(url, cache, transport, refresh)
+    key = (url, record.get('hash') or body_hash(record['body']))
+    value = DECODED_BODIES.get(key)
+    if value is None:
+        value = json.loads(record['body'])
+        DECODED_BODIES.set(key, value)
+    return value
+
+def cache_root():
+    """
+    Returns the cache root directory: cache_dir from ~/.togglrc, or
+    default_cache_dir().
+    """
+    return os.path.expanduser(
+        Config().get_default('options', 'cache_dir', default_cache_dir()))
+
+def data_root():
+    """
+    Returns the directory for files that must not be lost with the cache
+    (e.g. the journal): data_dir from ~/.togglrc, or default_data_dir().
+    """
+    return os.path.expanduser(
+        Config().get_default('options', 'data_dir', default_data_dir()))
+
+def default_namespace():
+    """
+    Returns the cache namespace of the account configured in ~/.togglrc.
+    """
+    return username_namespace(Config().get_credentials()[0])
+
+def default_cache_dir():
+    """
+    Returns the default cache root directory, honouring $XDG_CACHE_HOME.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache')
+    return os.path.join(base, 'pytoggl')
+
+def default_data_dir():
+    """
+    Returns the default data directory, honouring $XDG_DATA_HOME.
+    """
+    base = os.environ.get('XDG_DATA_HOME') or os.path.join('~', '.local', 'share')
+    return os.path.join(base, 'pytoggl')
+
+def username_namespace(username):
+    """
+    Returns the cache namespace for the given API token or username.
+    """
+    return hashlib.sha1(username or '').hexdigest()[:16]
+
+def _cached_record(url, cache, transport, refresh=False):
+    if cache is None:
+        cache = DefaultCache()
+    if transport is None:
+        transport = DefaultTransport()
+    record = cache.get_record(url)
+    if record is not None and cache.is_fresh(record) and not refresh:
+        return record
+
+    headers = {}
+    if record is not None:
+        if record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+    r = transport.request(url, 'get', headers=headers)
+    if record is not None and (r.status_code == 304 or body_hash(r.text) == record.get('hash')):
+        cache.touch(record)
+        return record
+    return cache.set(url, r.text, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+
+def write_json_atomic(path, obj):
+    """
+    Writes obj as JSON to path. The data is written to a temporary file and
+    renamed into place, so concurrent readers never see a partial file.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f)
+    os.rename(tmp_path, path)
@@ -0,0 +1,250 @@
+"""
+client.py
+
+Per-account toggl clients. Unlike the process-wide singletons configured
+from ~/.togglrc, each TogglClient carries its own credentials, workspace,
+timezone, connection pool and metadata cache, so one process can serve
+many accounts at once:
+
+    for token in tokens:
+        client = TogglClient(api_token=token)
+        print client.projects()
+"""
+
+import os
+import threading
+
+import requests
+
+from . import toggl
+from .cache import MetadataCache, auth_namespace, cached_get, cached_get_json, default_cache_dir, \
+    default_data_dir
+from .journal import Journal
+from .state import RunningEntryState
+from .utility import DateAndTime, Transport
+
+#----------------------------------------------------------------------------
+# TogglClient
+#----------------------------------------------------------------------------
+class TogglClient(object):
+    """
+    A toggl account. Pass it as the client argument of ClientList,
+    ProjectList, TimeEntry, TimeEntryList, User and iter_time_entries(), or
+    use the accessors below. Nothing is read from ~/.togglrc.
+
+    User, project and client data is fetched once per client and then
+    reused; call invalidate() to refetch it.
+    """
+
+    def __init__(self, api_token=None, username=None, password=None, workspace_id=None,
+                 timezone='UTC', time_format='%I:%M%p', cache_dir=None,
+                 cache_ttl=MetadataCache.DEFAULT_TTL, url=None, queue_writes=False,
+                 state_ttl=RunningEntryState.DEFAULT_TTL, data_dir=None, **transport_options):
+        """
+        * api_token(str), or username(str) and password(str), are the
+          account credentials.
+        * workspace_id(int) is the workspace to use. Defaults to the user's
+          default workspace.
+        * timezone(str) and time_format(str) control date handling, as the
+          options of the same name in ~/.togglrc do.
+        * cache_dir(str) and cache_ttl(int) configure the on-disk metadata
+          cache. Defaults to ~/.cache/pytoggl, shared safely between
+          accounts.
+        * url(str) is the API base URL. Defaults to pytoggl.toggl.TOGGL_URL.
+        * queue_writes(bool) queues every time entry change in the journal
+          instead of sending it; call flush() to send them. Changes are
+          queued anyway while toggl can't be reached.
+        * state_ttl(int) is how many seconds the locally recorded running
+          entry is trusted before it is checked with toggl.
+        * data_dir(str) is where the journal of unsent changes is kept.
+          Defaults to ~/.local/share/pytoggl; unlike the cache, it must not
+          be deleted.
+        * transport_options are passed to Transport, e.g. pool_size or
+          rate_limit. Unset options take the Transport class defaults.
+        """
+        if api_token is not None:
+            auth = requests.auth.HTTPBasicAuth(api_token, 'api_token')
+        elif username is not None and password is not None:
+            auth = requests.auth.HTTPBasicAuth(username, password)
+        else:
+            raise ValueError("TogglClient requires an api_token, or a username and password.")
+
+        for option in ('pool_size', 'connect_timeout', 'read_timeout',
+                       'rate_limit', 'rate_burst', 'max_retries'):
+            transport_options.setdefault(option, getattr(Transport, 'DEFAULT_' + option.upper()))
+
+        self.url = url or toggl.TOGGL_URL
+        self.transport = Transport(auth=auth, **transport_options)
+        self.namespace = auth_namespace(auth)
+        self.cache_dir = os.path.expanduser(cache_dir or default_cache_dir())
+        self.cache = MetadataCache(path=self.cache_dir, ttl=cache_ttl, namespace=self.namespace)
+        self.data_dir = os.path.expanduser(data_dir or default_data_dir())
+
+        self._journal = Journal(self, self.account_file('journal', '.jsonl', self.data_dir),
+                                queue_writes)
+        self._running_state = RunningEntryState(self.account_file('state'), state_ttl)
+        self._workspace_id = workspace_id
+        self._date_and_time = DateAndTime(timezone=timezone, time_format=time_format)
+        self._lock = threading.RLock()
+        self._user = None
+        self._projects = None
+        self._clients = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def account_file(self, kind, suffix='.json', root=None):
+        """
+        Returns the path of this account's local file of the given kind
+        (e.g. 'sync'), under root (the cache directory by default).
+        """
+        return os.path.join(root or self.cache_dir, kind, self.namespace + suffix)
+
+    def cached_get(self, url, refresh=False):
+        """
+        Returns the body of a GET request to url, through this client's
+        metadata cache. refresh revalidates a fresh cached body.
+        """
+        return cached_get(url, cache=self.cache, transport=self.transport, refresh=refresh)
+
+    def cached_get_json(self, url, refresh=False):
+        """
+        Returns the decoded JSON body of a GET request to url, through this
+        client's metadata cache. The value must not be modified.
+        """
+        return cached_get_json(url, cache=self.cache, transport=self.transport, refresh=refresh)
+
+    def clients(self):
+        """
+        Returns this account's ClientList.
+        """
+        with self._lock:
+            if self._clients is None:
+                self._clients = toggl.ClientList(client=self)
+            return self._clients
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        self.transport.close()
+
+    def current_time_entry(self, max_age=None):
+        """
+        Returns this account's running TimeEntry, or None. See
+        pytoggl.toggl.current_time_entry().
+        """
+        return toggl.current_time_entry(client=self, max_age=max_age)
+
+    def date_and_time(self):
+        """
+        Returns the DateAndTime helper for this client's timezone.
+        """
+        return self._date_and_time
+
+    def delete_time_entries(self, ids, workers=8):
+        """
+        Deletes this account's time entries with the given ids. See
+        pytoggl.toggl.delete_time_entries().
+        """
+        return toggl.delete_time_entries(ids, client=self, workers=workers)
+
+    def flush(self):
+        """
+        Sends queued time entry changes. Returns a
+        pytoggl.journal.FlushResult.
+        """
+        return self._journal.flush()
+
+    def httpexec(self, url, method, data=None):
+        """
+        Makes an HTTP request as this account. Returns the raw text data
+        received, or raises a TogglError.
+        """
+        return self.transport.request(url, method, data=data,
+            headers={'content-type': 'application/json'}).text
+
+    def invalidate(self):
+        """
+        Drops cached user, project and client data, in memory and on disk.
+        """
+        with self._lock:
+            self._user = self._projects = self._clients = None
+            self.cache.invalidate()
+
+    def journal(self):
+        """
+        Returns this account's journal of queued time entry changes.
+        """
+        return self._journal
+
+    def iter_json(self, url):
+        """
+        GETs url as this account and yields the elements of the JSON array
+        returned, decoding the response as it streams in.
+        """
+        return self.transport.iter_json(url)
+
+    def iter_time_entries(self, start_time, end_time, **kw):
+        """
+        Lazily yields this account's time entries between the given
+        localized datetimes. See pytoggl.toggl.iter_time_entries().
+        """
+        return toggl.iter_time_entries(start_time, end_time, client=self, **kw)
+
+    def new_entry(self, **kw):
+        """
+        Returns a new TimeEntry for this account. Keyword arguments are
+        passed to the TimeEntry constructor.
+        """
+        return toggl.TimeEntry(client=self, **kw)
+
+    def projects(self):
+        """
+        Returns the ProjectList of this client's workspace.
+        """
+        with self._lock:
+            if self._projects is None:
+                self._projects = toggl.ProjectList(client=self)
+            return self._projects
+
+    def running_state(self):
+        """
+        Returns this account's locally recorded running entry state.
+        """
+        return self._running_state
+
+    def time_entries(self):
+        """
+        Returns a newly fetched TimeEntryList of this account's recent
+        entries.
+        """
+        return toggl.TimeEntryList(client=self)
+
+    def update_time_entries(self, ids, fields, workers=8):
+        """
+        Sets the given fields on this account's time entries with the given
+        ids. See pytoggl.toggl.update_time_entries().
+        """
+        return toggl.update_time_entries(ids, fields, client=self, workers=workers)
+
+    def user(self):
+        """
+        Returns this account's User.
+        """
+        with self._lock:
+            if self._user is None:
+                self._user = toggl.User(client=self)
+            return self._user
+
+    def workspace_id(self):
+        """
+        Returns the workspace id given to the constructor, or the user's
+        default workspace id.
+        """
+        if self._workspace_id is None:
+            self._workspace_id = self.user().get('default_wid')
+        return self._workspace_id
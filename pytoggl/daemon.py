@@ -0,0 +1,208 @@
+"""
+daemon.py
+
+A long-running process that executes CLI commands on behalf of thin
+clients, so repeated invocations reuse its warm HTTP session, parsed
+configuration and metadata instead of paying for them on every run.
+
+Clients connect to a Unix socket in the cache directory, send one JSON
+request and read back one JSON response:
+
+    request:  {"argv": [...], "cwd": "..."}  or  {"command": "stop"}
+    response: {"status": 0, "stdout": "...", "stderr": "..."}
+
+Requests are executed one at a time, since the command output is captured
+by temporarily replacing sys.stdout and sys.stderr.
+"""
+
+import errno
+import json
+import os
+import socket
+import StringIO
+import sys
+import threading
+import traceback
+
+from .cache import cache_root
+
+SOCKET_NAME = 'daemon.sock'
+CLIENT_TIMEOUT = 30.0  # seconds to wait for a client to send its request
+
+#----------------------------------------------------------------------------
+# Daemon
+#----------------------------------------------------------------------------
+class Daemon(object):
+    """
+    Serves command requests on a Unix socket.
+    """
+
+    def __init__(self, handler, path=None):
+        """
+        * handler is a function taking a list of command line arguments,
+          running the command and returning its exit status. Anything it
+          prints is sent back to the client.
+        * path(str) is the socket path. Defaults to socket_path().
+        """
+        self.handler = handler
+        self.path = path or socket_path()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def serve_forever(self, on_ready=None):
+        """
+        Binds the socket and serves requests until a stop request arrives.
+        on_ready is an optional function called once the socket is bound.
+        Raises RuntimeError if another daemon is already serving the socket.
+        """
+        server = self._bind()
+        self.running = True
+        if on_ready is not None:
+            on_ready()
+        try:
+            while self.running:
+                conn, _ = server.accept()
+                try:
+                    self._serve(conn)
+                except socket.error:
+                    pass # the client went away
+                finally:
+                    conn.close()
+        finally:
+            server.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _bind(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        if os.path.exists(self.path):
+            conn = _connect(self.path)
+            if conn is not None:
+                conn.close()
+                raise RuntimeError("A daemon is already running on %s." % self.path)
+            os.remove(self.path) # left behind by a daemon that died
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0177)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen(16)
+        return server
+
+    def _run(self, argv, cwd):
+        """
+        Runs the handler with stdout and stderr captured. Returns the
+        response dictionary.
+        """
+        with self.lock:
+            stdout, stderr, old_cwd = sys.stdout, sys.stderr, os.getcwd()
+            sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+            try:
+                os.chdir(cwd)
+                status = self.handler(argv)
+            except SystemExit, e:
+                status = e.code
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            finally:
+                response = {'stdout': sys.stdout.getvalue(), 'stderr': sys.stderr.getvalue()}
+                sys.stdout, sys.stderr = stdout, stderr
+                os.chdir(old_cwd)
+
+        if status is None:
+            status = 0
+        elif not isinstance(status, int):
+            response['stderr'] += "%s\n" % status
+            status = 1
+        response['status'] = status
+        return response
+
+    def _serve(self, conn):
+        conn.settimeout(CLIENT_TIMEOUT)
+        data = _recv_all(conn)
+        conn.settimeout(None)
+        try:
+            request = json.loads(data)
+            if request.get('command') == 'stop':
+                self.running = False
+                response = {'status': 0, 'stdout': '', 'stderr': ''}
+            else:
+                argv = request['argv']
+                response = None
+        except (AttributeError, KeyError, ValueError):
+            # e.g. a connection probing whether the daemon is running
+            response = {'status': 2, 'stdout': '', 'stderr': "Malformed daemon request.\n"}
+        if response is None:
+            response = self._run(argv, request.get('cwd') or '/')
+        conn.sendall(json.dumps(response))
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def call(argv, path=None):
+    """
+    Asks a running daemon to execute the given command line arguments,
+    writing its output to stdout and stderr. Returns the command's exit
+    status, or None if no daemon is running.
+    """
+    if path is None:
+        if not os.path.exists(os.path.expanduser('~/.togglrc')):
+            return None # not configured yet, so no daemon can be running
+        path = socket_path()
+    conn = _connect(path)
+    if conn is None:
+        return None
+    response = _request(conn, {'argv': argv, 'cwd': os.getcwd()})
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+def socket_path():
+    """
+    Returns the path of the daemon's socket, in the cache directory.
+    """
+    return os.path.join(cache_root(), SOCKET_NAME)
+
+def stop(path=None):
+    """
+    Asks a running daemon to exit. Returns False if none was running.
+    """
+    conn = _connect(path or socket_path())
+    if conn is None:
+        return False
+    _request(conn, {'command': 'stop'})
+    return True
+
+def _connect(path):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except socket.error, e:
+        conn.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return conn
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+def _request(conn, request):
+    try:
+        conn.sendall(json.dumps(request))
+        conn.shutdown(socket.SHUT_WR)
+        return json.loads(_recv_all(conn))
+    finally:
+        conn.close()
@@ -0,0 +1,331 @@
+"""
+journal.py
+
+A durable queue of time entry changes that haven't reached toggl yet.
+
+Changes are appended to a per-account JSON lines file when toggl can't be
+reached (or always, if writes are queued), and replayed in order by
+Journal.flush(). Each created entry carries a client-generated guid, so a
+create that did reach toggl before the connection failed is recognized on
+replay instead of being duplicated. Changes to an entry whose create is
+still queued refer to it by guid until its id is known. After toggl has
+been unreachable, changes are queued without trying it again for
+OFFLINE_RETRY_INTERVAL seconds, so commands don't wait on it.
+
+The journal is kept under ~/.local/share/pytoggl (or $XDG_DATA_HOME, or
+the data_dir option in ~/.togglrc) rather than with the cache, since
+deleting it would lose the queued changes.
+
+Setting queue_writes = true in the [options] section of ~/.togglrc queues
+every change, so commands never wait for toggl. `toggl-cli.py daemon`
+flushes the journal in the background; otherwise run `toggl-cli.py flush`.
+"""
+
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import time
+
+from .utility import Logger, TogglConnectionError, TogglError, TogglHTTPError
+
+ID_PLACEHOLDER = '{id}' # stands for the id of the entry named by an op's ref
+OFFLINE_RETRY_INTERVAL = 60 # seconds send() queues without retrying after a connection failure
+
+#----------------------------------------------------------------------------
+# FlushResult
+#----------------------------------------------------------------------------
+class FlushResult(object):
+    """
+    The outcome of one Journal.flush() call.
+    Properties:
+        replayed - number of changes sent to toggl.
+        failed - list of (op, error) tuples for changes toggl rejected.
+          They are dropped from the journal.
+        remaining - number of changes still queued.
+    """
+
+    def __init__(self):
+        self.replayed = 0
+        self.failed = []
+        self.remaining = 0
+
+    def __str__(self):
+        return "%d replayed, %d failed, %d remaining" % \
+            (self.replayed, len(self.failed), self.remaining)
+
+#----------------------------------------------------------------------------
+# Journal
+#----------------------------------------------------------------------------
+class Journal(object):
+    """
+    The queue of pending changes for one account. Safe to share between
+    threads and processes.
+    """
+
+    def __init__(self, client, path, queue_writes=False):
+        """
+        * client is the DefaultClient or TogglClient the changes belong to.
+        * path(str) is the journal file.
+        * queue_writes(bool) makes send() always queue changes, leaving them
+          for flush() to send.
+        """
+        self.client = client
+        self.path = path
+        self.queue_writes = queue_writes
+        self.known_ids = {} # guid -> id of entries created through this journal
+
+    def append(self, method, path, data=None, guid=None, ref=None):
+        """
+        Queues a change. path is relative to the client's API URL and may
+        contain ID_PLACEHOLDER, which is replaced on replay with the id of the
+        entry whose guid is ref.
+        """
+        op = {
+            'method': method,
+            'path': path,
+            'data': data,
+            'guid': guid,
+            'ref': ref,
+            'queued_at': time.time(),
+        }
+        with self._locked():
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(op) + "\n")
+
+    def flush(self):
+        """
+        Replays queued changes in order, stopping at the first one that can't
+        be sent yet (e.g. because toggl is still unreachable). Returns a
+        FlushResult.
+        """
+        with self._locked('.flush'):
+            return self._flush()
+
+    def id_for(self, guid):
+        """
+        Returns the id toggl assigned to the entry with the given guid, if
+        this journal has seen it, or None.
+        """
+        return self.known_ids.get(guid)
+
+    def _flush(self):
+        result = FlushResult()
+        with self._locked():
+            ops, ids = self._read()
+
+        done = 0
+        for op in ops:
+            try:
+                if op.get('ref') and op['ref'] not in ids:
+                    # The entry was created by an earlier flush.
+                    existing = self._find_created(op['ref'], op['data'])
+                    if existing is None:
+                        error = RuntimeError("The entry this change refers to was never created.")
+                        Logger.info("Dropped queued %s %s: %s" % (op['method'].upper(), op['path'], error))
+                        result.failed.append((op, error))
+                        done += 1
+                        continue
+                    ids[op['ref']] = existing.get('id')
+                self._replay(op, ids)
+                result.replayed += 1
+            except TogglConnectionError:
+                self._mark_offline()
+                break
+            except TogglHTTPError, e:
+                if e.status_code == 429 or e.status_code >= 500:
+                    break
+                Logger.info("Dropped queued %s %s: %s" % (op['method'].upper(), op['path'], e))
+                result.failed.append((op, e))
+            done += 1
+
+        if done:
+            with self._locked():
+                current, _ = self._read()
+                # Changes queued while flushing are appended after ours.
+                remaining = current[done:]
+                refs = set(op['ref'] for op in remaining if op.get('ref'))
+                lines = [json.dumps(op) for op in remaining]
+                lines += [json.dumps({'guid': guid, 'id': entry_id})
+                          for guid, entry_id in ids.items() if guid in refs]
+                self._write(lines)
+            result.remaining = len(remaining)
+        else:
+            result.remaining = len(ops)
+        if result.remaining == 0:
+            self._mark_online()
+
+        state = self.client.running_state()
+        for guid, entry_id in ids.items():
+            self.known_ids[guid] = entry_id
+            state.set_id(guid, entry_id)
+        return result
+
+    def pending(self):
+        """
+        Returns True if any changes are queued.
+        """
+        try:
+            return os.path.getsize(self.path) > 0
+        except OSError:
+            return False
+
+    def send(self, method, path, data=None, guid=None, ref=None, queued_path=None):
+        """
+        Sends a change to toggl and returns the decoded response, if any. The
+        change is queued instead, and None returned, if writes are queued,
+        earlier changes are still pending or toggl can't be reached.
+        queued_path is an alternative path to queue the change under.
+
+        Unless writes are queued, pending changes are flushed first, so they
+        reach toggl in order as soon as it is reachable again. While toggl
+        has been unreachable within the last OFFLINE_RETRY_INTERVAL seconds,
+        changes are queued straight away instead of waiting for it again.
+
+        If the path contains ID_PLACEHOLDER, ref is the guid of the entry
+        whose id replaces it. Raises a TogglError if no such entry exists.
+        """
+        if not self.queue_writes and self.pending() and not self._offline():
+            self.flush()
+        if not self.queue_writes and not self.pending() and not self._offline():
+            try:
+                if ref is not None:
+                    path = path.replace(ID_PLACEHOLDER, str(self._resolve(ref, data)))
+                    ref = None
+                response = self.client.httpexec(self.client.url + path, method, data)
+                self._mark_online()
+                return json.loads(response) if response else None
+            except TogglConnectionError, e:
+                self._mark_offline()
+                Logger.info("Could not reach toggl; the change was queued. (%s)" % e)
+        self.append(method, queued_path or path, data, guid, ref)
+        return None
+
+    @contextlib.contextmanager
+    def _locked(self, suffix='.lock'):
+        # Locks are taken on separate files, since the journal itself is
+        # replaced when it is rewritten. '.lock' guards the file's contents,
+        # '.flush' makes flushes take turns.
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        with open(self.path + suffix, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _mark_offline(self):
+        # Kept as a file, so later commands know too.
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        with open(self.path + '.offline', 'w'):
+            pass
+
+    def _mark_online(self):
+        try:
+            os.remove(self.path + '.offline')
+        except OSError:
+            pass
+
+    def _offline(self):
+        """
+        Returns True if toggl couldn't be reached within the last
+        OFFLINE_RETRY_INTERVAL seconds.
+        """
+        try:
+            return time.time() - os.path.getmtime(self.path + '.offline') < OFFLINE_RETRY_INTERVAL
+        except OSError:
+            return False
+
+    def _read(self):
+        """
+        Returns the list of queued ops and the dictionary of known guid to
+        id mappings.
+        """
+        ops = []
+        ids = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # a partially written line
+                    if 'method' in record:
+                        ops.append(record)
+                    else:
+                        ids[record['guid']] = record['id']
+        except IOError:
+            pass
+        return ops, ids
+
+    def _resolve(self, guid, data):
+        """
+        Returns the id of the entry with the given guid, whose create is no
+        longer queued. data is the change's JSON body.
+        """
+        entry_id = self.known_ids.get(guid)
+        if entry_id is None:
+            existing = self._find_created(guid, data)
+            if existing is None:
+                raise TogglError("The time entry this change refers to was never created.")
+            entry_id = self.known_ids[guid] = existing.get('id')
+        return entry_id
+
+    def _replay(self, op, ids):
+        path = op['path']
+        if op.get('ref'):
+            path = path.replace(ID_PLACEHOLDER, str(ids[op['ref']]))
+
+        if op['method'] == 'post' and op.get('guid'):
+            existing = self._find_created(op['guid'], op['data'])
+            if existing is not None:
+                ids[op['guid']] = existing.get('id')
+                return
+
+        try:
+            response = self.client.httpexec(self.client.url + path, op['method'], op.get('data'))
+        except TogglHTTPError, e:
+            if op['method'] == 'delete' and e.status_code == 404:
+                return # already deleted
+            raise
+        if op['method'] == 'post' and op.get('guid') and response:
+            data = json.loads(response).get('data') or {}
+            if data.get('id'):
+                ids[op['guid']] = data['id']
+
+    def _find_created(self, guid, data):
+        """
+        Returns the entry on the server with the given guid, or None. data
+        is a queued change's JSON body, whose start time is used to narrow
+        the search.
+        """
+        from .toggl import iter_time_entries
+        entry = json.loads(data or '{}').get('time_entry') or {}
+        dt = self.client.date_and_time()
+        if entry.get('start'):
+            start_time = dt.parse_iso_str(entry['start'])
+        elif entry.get('stop') and entry.get('duration') >= 0:
+            # e.g. a stop, which carries only the stop time and duration
+            start_time = dt.parse_iso_str(entry['stop']) - \
+                datetime.timedelta(seconds=int(entry['duration']))
+        else:
+            return None
+        slack = datetime.timedelta(minutes=1)
+        for existing in iter_time_entries(start_time - slack, start_time + slack, client=self.client):
+            if existing.get('guid') == guid:
+                return existing
+        return None
+
+    def _write(self, lines):
+        if lines:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            os.rename(tmp_path, self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
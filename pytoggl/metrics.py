@@ -0,0 +1,220 @@
+"""
+metrics.py
+
+Per-endpoint statistics of the requests made to toggl: how many, how long
+they took, how much data they moved and how often they were retried.
+
+    metrics = RequestMetrics().install()
+    ...
+    metrics.uninstall()
+    print metrics.summary()
+
+RequestMetrics collects the RequestEvents passed to Transport's request
+hooks. Endpoints are named by method and path, with ids replaced by {id}
+so that e.g. every GET /time_entries/{id} is counted together. The
+statistics can be exported as JSON or in the Prometheus text format.
+`toggl-cli.py --profile` prints them for a single command.
+"""
+
+import json
+import re
+import threading
+import urlparse
+
+from .utility import Transport
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+API_PREFIX = re.compile(r'^/api/v\d+')
+NUMERIC_SEGMENT = re.compile(r'/\d+(?:,\d+)*(?=/|$)')
+
+#----------------------------------------------------------------------------
+# EndpointStats
+#----------------------------------------------------------------------------
+class EndpointStats(object):
+    """
+    The statistics of one endpoint.
+    Properties:
+        requests - number of requests made.
+        errors - number of requests that failed.
+        retries - number of retries, over all requests.
+        bytes_sent and bytes_received - body sizes, over all requests.
+        total_time and max_time - request times in seconds.
+        buckets - list of request counts per LATENCY_BUCKETS bound, plus one
+          for slower requests. Counts are not cumulative.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, event):
+        """
+        Adds the given finished RequestEvent.
+        """
+        self.requests += 1
+        if event.error is not None:
+            self.errors += 1
+        self.retries += event.retries
+        self.bytes_sent += event.bytes_sent
+        self.bytes_received += event.bytes_received
+        self.total_time += event.elapsed
+        self.max_time = max(self.max_time, event.elapsed)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if event.elapsed <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets)),
+        }
+
+#----------------------------------------------------------------------------
+# RequestMetrics
+#----------------------------------------------------------------------------
+class RequestMetrics(object):
+    """
+    Collects EndpointStats for the requests made while it is installed.
+    Thread-safe.
+    """
+
+    def __init__(self):
+        self.endpoints = {} # endpoint name -> EndpointStats
+        self._lock = threading.Lock()
+        self._hook = None
+
+    def install(self):
+        """
+        Starts collecting the requests made by every Transport. Returns self.
+        """
+        if self._hook is None:
+            self._hook = Transport.add_hook(after=self.record)
+        return self
+
+    def uninstall(self):
+        """
+        Stops collecting requests.
+        """
+        if self._hook is not None:
+            Transport.remove_hook(self._hook)
+            self._hook = None
+
+    def record(self, event):
+        """
+        Adds a finished RequestEvent to the statistics of its endpoint.
+        """
+        name = endpoint_name(event.method, event.url)
+        with self._lock:
+            if name not in self.endpoints:
+                self.endpoints[name] = EndpointStats()
+            self.endpoints[name].add(event)
+
+    def totals(self):
+        """
+        Returns an EndpointStats summing every endpoint, except for the
+        latency histogram.
+        """
+        totals = EndpointStats()
+        with self._lock:
+            for stats in self.endpoints.values():
+                for key in ('requests', 'errors', 'retries', 'bytes_sent',
+                            'bytes_received', 'total_time'):
+                    setattr(totals, key, getattr(totals, key) + getattr(stats, key))
+                totals.max_time = max(totals.max_time, stats.max_time)
+        return totals
+
+    def summary(self):
+        """
+        Returns a table of the statistics, slowest endpoints first.
+        """
+        with self._lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda item: -item[1].total_time)
+        lines = ["%-40s %5s %5s %5s %9s %9s %9s" %
+                 ('Endpoint', 'Reqs', 'Errs', 'Retry', 'Total', 'Max', 'Received')]
+        for name, stats in endpoints + [('Total', self.totals())]:
+            lines.append("%-40s %5d %5d %5d %8.0fms %8.0fms %9s" %
+                         (name, stats.requests, stats.errors, stats.retries,
+                          stats.total_time * 1000, stats.max_time * 1000,
+                          _format_bytes(stats.bytes_received)))
+        return "\n".join(lines)
+
+    def to_json(self):
+        """
+        Returns the statistics as a JSON object string, keyed by endpoint.
+        """
+        with self._lock:
+            return json.dumps(dict((name, stats.as_dict())
+                                   for name, stats in self.endpoints.items()),
+                              indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Returns the statistics in the Prometheus text exposition format.
+        """
+        lines = []
+        def metric(name, kind, help_text):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+
+        metric('toggl_request_duration_seconds', 'histogram', 'Time taken by toggl API requests.')
+        for name, stats in endpoints:
+            labels = _labels(name)
+            count = 0
+            for bound, n in zip(LATENCY_BUCKETS, stats.buckets):
+                count += n
+                lines.append('toggl_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('toggl_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, stats.requests))
+            lines.append('toggl_request_duration_seconds_sum{%s} %f' % (labels, stats.total_time))
+            lines.append('toggl_request_duration_seconds_count{%s} %d' % (labels, stats.requests))
+
+        for key, help_text in (('errors', 'Failed toggl API requests.'),
+                               ('retries', 'Retried toggl API requests.'),
+                               ('bytes_sent', 'Bytes sent in toggl API request bodies.'),
+                               ('bytes_received', 'Bytes received in toggl API response bodies.')):
+            name = 'toggl_request_%s_total' % key
+            metric(name, 'counter', help_text)
+            for endpoint, stats in endpoints:
+                lines.append('%s{%s} %d' % (name, _labels(endpoint), getattr(stats, key)))
+        return "\n".join(lines) + "\n"
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def endpoint_name(method, url):
+    """
+    Returns the name statistics for a request are kept under, e.g.
+    'GET /time_entries/{id}'.
+    """
+    path = API_PREFIX.sub('', urlparse.urlparse(url).path)
+    return "%s %s" % (method.upper(), NUMERIC_SEGMENT.sub('/{id}', path) or '/')
+
+def _format_bytes(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return "%d%s" % (n, unit)
+        n /= 1024.0
+    return "%.1fGB" % n
+
+def _labels(endpoint):
+    method, path = endpoint.split(' ', 1)
+    return 'method="%s",endpoint="%s"' % (method, path.replace('\\', '\\\\').replace('"', '\\"'))
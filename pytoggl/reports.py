@@ -0,0 +1,304 @@
+"""
+reports.py
+
+Client for the toggl Reports API (v2). The server aggregates time entries
+into summary, weekly and detailed reports, so totals can be fetched
+without downloading every raw entry:
+
+    report = Reports().summary('2014-06-01', '2014-06-30')
+    for group in report.groups:
+        print group.name, group.seconds
+
+All durations are converted from the API's milliseconds to seconds. The
+[options] section of ~/.togglrc may set reports_url, the Reports API base
+URL (e.g. of a mock or self-hosted server), as api_url does for v8.
+"""
+
+import datetime
+import json
+import urllib
+
+from .toggl import DefaultClient
+from .utility import Config, Logger
+
+REPORTS_URL = "https://toggl.com/reports/api/v2"
+USER_AGENT = "pytoggl"
+
+# Title keys naming a report group, most specific first.
+TITLE_KEYS = ('time_entry', 'task', 'user', 'project', 'client')
+
+#----------------------------------------------------------------------------
+# ReportGroup
+#----------------------------------------------------------------------------
+class ReportGroup(object):
+    """
+    One group (e.g. a project) of a summary or weekly report.
+    Properties:
+        id - the id of the grouped object, or None.
+        title - dictionary describing the group, e.g. {'project': 'Foo',
+          'client': 'Bar'}.
+        name - the group's name, or None (e.g. for entries without a
+          project).
+        seconds - total time in the group, in seconds.
+        totals - weekly reports only: list of the seconds on each day of the
+          week, followed by the week's total.
+        items - list of ReportGroup sub-groups.
+        data - the group dictionary returned by toggl.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.id = data.get('id', data.get('pid', data.get('uid')))
+        self.title = data.get('title') or {}
+        self.name = None
+        for key in TITLE_KEYS:
+            if self.title.get(key):
+                self.name = self.title[key]
+                break
+        if 'totals' in data:
+            self.totals = [_seconds(ms) for ms in data['totals']]
+            self.seconds = self.totals[-1] if self.totals else 0.0
+            subgroups = data.get('details') or []
+        else:
+            self.totals = None
+            self.seconds = _seconds(data.get('time'))
+            subgroups = data.get('items') or []
+        self.items = [ReportGroup(item) for item in subgroups]
+
+    def __str__(self):
+        return "%s: %s" % (self.name or '(none)', _elapsed(self.seconds))
+
+#----------------------------------------------------------------------------
+# ReportEntry
+#----------------------------------------------------------------------------
+class ReportEntry(object):
+    """
+    One time entry of a detailed report. The entry dictionary returned by
+    toggl is available through get(), with project and client names
+    already filled in.
+    Properties:
+        seconds - the entry's duration, in seconds.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.seconds = _seconds(data.get('dur'))
+
+    def get(self, prop):
+        """
+        Returns the given entry property, or None.
+        """
+        return self.data.get(prop)
+
+    def __str__(self):
+        s = "%s %s" % (self.get('start'), self.get('description') or '')
+        if self.get('project'):
+            s += " @%s" % self.get('project')
+        return "%s %s" % (s, _elapsed(self.seconds))
+
+#----------------------------------------------------------------------------
+# SummaryReport
+#----------------------------------------------------------------------------
+class SummaryReport(object):
+    """
+    Time totals grouped (by default) by project, and sub-grouped by time
+    entry description.
+    Properties:
+        total_seconds - total time in the report, in seconds.
+        billable_seconds - total billable time, in seconds.
+        groups - list of ReportGroup objects.
+        data - the report dictionary returned by toggl.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.total_seconds = _seconds(data.get('total_grand'))
+        self.billable_seconds = _seconds(data.get('total_billable'))
+        self.groups = [ReportGroup(group) for group in data.get('data') or []]
+
+    def __str__(self):
+        lines = ["Total: %s" % _elapsed(self.total_seconds)]
+        for group in self.groups:
+            lines.append("  %s" % group)
+            for item in group.items:
+                lines.append("    %s" % item)
+        return "\n".join(lines)
+
+#----------------------------------------------------------------------------
+# WeeklyReport
+#----------------------------------------------------------------------------
+class WeeklyReport(object):
+    """
+    Daily time totals for one week, grouped (by default) by project.
+    Properties:
+        total_seconds - total time in the report, in seconds.
+        billable_seconds - total billable time, in seconds.
+        week_totals - list of the seconds on each day of the week, followed
+          by the week's total.
+        groups - list of ReportGroup objects, with totals set.
+        data - the report dictionary returned by toggl.
+    """
+
+    def __init__(self, data, since=None):
+        """
+        * data(dict) is the report returned by toggl.
+        * since(str) is the first day of the week, as 'YYYY-MM-DD', used to
+          label the days. Days are numbered if it isn't known.
+        """
+        self.data = data
+        self.since = since
+        self.total_seconds = _seconds(data.get('total_grand'))
+        self.billable_seconds = _seconds(data.get('total_billable'))
+        self.week_totals = [_seconds(ms) for ms in data.get('week_totals') or []]
+        self.groups = [ReportGroup(group) for group in data.get('data') or []]
+
+    def __str__(self):
+        if self.since:
+            first = datetime.datetime.strptime(self.since, "%Y-%m-%d")
+            days = [(first + datetime.timedelta(days=i)).strftime("%a") for i in range(7)]
+        else:
+            days = ["Day %d" % (i + 1) for i in range(7)]
+        row = lambda name, cells: "%-20.20s %s" % (name, " ".join("%6s" % c for c in cells))
+        hours = lambda totals: ["%.2f" % (seconds / 3600.0) for seconds in totals]
+
+        lines = [row('', days + ['Total'])]
+        for group in self.groups:
+            lines.append(row(group.name or '(none)', hours(group.totals)))
+        lines.append(row('Total', hours(self.week_totals)))
+        return "\n".join(lines)
+
+#----------------------------------------------------------------------------
+# DetailedReport
+#----------------------------------------------------------------------------
+class DetailedReport(object):
+    """
+    The individual time entries matching a report query. toggl returns
+    them one page at a time; iterating over the report yields every
+    ReportEntry, fetching the remaining pages as they are needed.
+    Properties:
+        total_count - number of entries in the report.
+        per_page - number of entries per page.
+        total_seconds - total time in the report, in seconds.
+        billable_seconds - total billable time, in seconds.
+        entries - list of the ReportEntry objects on the first page.
+    """
+
+    def __init__(self, reports, params, data):
+        self.reports = reports
+        self.params = params
+        self.total_count = data.get('total_count') or 0
+        self.per_page = data.get('per_page') or 0
+        self.total_seconds = _seconds(data.get('total_grand'))
+        self.billable_seconds = _seconds(data.get('total_billable'))
+        self.entries = [ReportEntry(entry) for entry in data.get('data') or []]
+
+    def __iter__(self):
+        entries = self.entries
+        page = 1
+        count = 0
+        while entries:
+            for entry in entries:
+                yield entry
+            count += len(entries)
+            if count >= self.total_count:
+                break
+            page += 1
+            data = self.reports._get('details', dict(self.params, page=page))
+            entries = [ReportEntry(entry) for entry in data.get('data') or []]
+
+    def __len__(self):
+        return self.total_count
+
+    def __str__(self):
+        lines = [str(entry) for entry in self]
+        lines.append("Total: %s" % _elapsed(self.total_seconds))
+        return "\n".join(lines)
+
+#----------------------------------------------------------------------------
+# Reports
+#----------------------------------------------------------------------------
+class Reports(object):
+    """
+    Fetches reports for a workspace.
+
+    Each report method takes the first and last day of the report, as
+    date, datetime or 'YYYY-MM-DD' values; toggl defaults to the last
+    seven days. Further keyword arguments are passed to toggl as report
+    parameters, e.g. grouping='users', project_ids=[1, 2] or billable='yes'.
+    """
+
+    def __init__(self, client=None, workspace_id=None, url=None, user_agent=USER_AGENT):
+        """
+        * client is an optional TogglClient to fetch through; by default the
+          account configured in ~/.togglrc is used.
+        * workspace_id(int) is the workspace to report on. Defaults to the
+          client's workspace.
+        * url(str) is the Reports API base URL. Defaults to reports_url
+          from the [options] section of ~/.togglrc when the default client
+          is used, or REPORTS_URL.
+        * user_agent(str) identifies the application to toggl, which
+          requires it on every report request.
+        """
+        self.client = client or DefaultClient()
+        self.workspace_id = workspace_id
+        if url is None and isinstance(self.client, DefaultClient):
+            url = Config().get_default('options', 'reports_url', REPORTS_URL)
+        self.url = url or REPORTS_URL
+        self.user_agent = user_agent
+
+    def detailed(self, since=None, until=None, **params):
+        """
+        Returns a DetailedReport of the time entries in the given days.
+        """
+        params = self._params(since, until, params)
+        return DetailedReport(self, params, self._get('details', dict(params, page=1)))
+
+    def summary(self, since=None, until=None, **params):
+        """
+        Returns a SummaryReport of the given days.
+        """
+        return SummaryReport(self._get('summary', self._params(since, until, params)))
+
+    def weekly(self, since=None, **params):
+        """
+        Returns a WeeklyReport of the week starting on the given day.
+        """
+        params = self._params(since, None, params)
+        return WeeklyReport(self._get('weekly', params), params.get('since'))
+
+    def _get(self, report, params):
+        url = "%s/%s?%s" % (self.url, report, urllib.urlencode(sorted(params.items())))
+        Logger.debug(url)
+        return json.loads(self.client.httpexec(url, 'get'))
+
+    def _params(self, since, until, params):
+        query = {
+            'user_agent': self.user_agent,
+            'workspace_id': self.workspace_id or self.client.workspace_id(),
+        }
+        if since is not None:
+            query['since'] = _date_str(since)
+        if until is not None:
+            query['until'] = _date_str(until)
+        for key, value in params.items():
+            if isinstance(value, (list, tuple, set)):
+                value = ','.join(str(v) for v in value)
+            elif isinstance(value, bool):
+                value = 'true' if value else 'false'
+            query[key] = value
+        return query
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def _date_str(day):
+    if isinstance(day, (datetime.date, datetime.datetime)):
+        return day.strftime("%Y-%m-%d")
+    return day
+
+def _elapsed(seconds):
+    minutes = int(round(seconds / 60.0))
+    return "%d:%02d" % (minutes // 60, minutes % 60)
+
+def _seconds(ms):
+    return (ms or 0) / 1000.0
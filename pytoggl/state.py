@@ -0,0 +1,97 @@
+"""
+state.py
+
+A local record of the running time entry, so asking what is running
+doesn't need a request. TimeEntry.start(), stop(), continue_entry() and
+delete() keep it up to date. Once it is older than its ttl it is checked
+against toggl's current entry, which picks up entries started or stopped
+elsewhere (e.g. in the web app).
+
+The [options] section of ~/.togglrc may set:
+    state_ttl - seconds the record is trusted for before being checked.
+"""
+
+import json
+import time
+
+from .cache import write_json_atomic
+
+STATE_VERSION = 1
+
+#----------------------------------------------------------------------------
+# RunningEntryState
+#----------------------------------------------------------------------------
+class RunningEntryState(object):
+    """
+    The running time entry of one account, persisted as a JSON file.
+    """
+
+    DEFAULT_TTL = 300
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        """
+        * path(str) is the file to persist the state in.
+        * ttl(int) is the number of seconds the state is trusted for.
+        """
+        self.path = path
+        self.ttl = int(ttl)
+
+    def get(self, max_age=None):
+        """
+        Returns the state as a dictionary with 'entry' (the running entry's
+        dictionary, or None if nothing is running) and 'checked_at' (when
+        it was last known to be right, in seconds since the epoch). Returns
+        None if there is no state, or it is older than max_age seconds
+        (the ttl by default).
+        """
+        if max_age is None:
+            max_age = self.ttl
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if state.get('version') != STATE_VERSION or \
+                time.time() - state['checked_at'] > max_age:
+            return None
+        return state
+
+    def remove(self, entry_data):
+        """
+        Records that the given entry dictionary is no longer running, if it
+        is the running entry.
+        """
+        state = self.get(float('inf'))
+        if state is None or state['entry'] is None:
+            return
+        if _same_entry(state['entry'], entry_data):
+            self.set(None)
+
+    def set_id(self, guid, entry_id):
+        """
+        Records the id toggl assigned to the entry with the given guid, if
+        it is the running entry.
+        """
+        state = self.get(float('inf'))
+        if state is None or state['entry'] is None or state['entry'].get('guid') != guid:
+            return
+        state['entry']['id'] = entry_id
+        write_json_atomic(self.path, state)
+
+    def set(self, entry_data):
+        """
+        Records the given entry dictionary, or None, as what is running now.
+        """
+        write_json_atomic(self.path, {
+            'version': STATE_VERSION,
+            'checked_at': time.time(),
+            'entry': dict(entry_data) if entry_data is not None else None,
+        })
+
+#----------------------------------------------------------------------------
+# Helpers
+#----------------------------------------------------------------------------
+def _same_entry(a, b):
+    if a.get('id') is not None and a.get('id') == b.get('id'):
+        return True
+    return a.get('guid') is not None and a.get('guid') == b.get('guid')
@@ -0,0 +1,170 @@
+"""
+sync.py
+
+Incremental time entry sync. A local EntryStore remembers every entry seen
+so far, and TimeEntrySync compares it against a recent window of server
+data to report what was added, updated or deleted since the last run.
+"""
+
+import datetime
+import json
+
+from .cache import account_file, write_json_atomic
+from .toggl import DefaultClient, TimeEntry, iter_time_entries
+
+STORE_VERSION = 1
+
+#----------------------------------------------------------------------------
+# EntryStore
+#----------------------------------------------------------------------------
+class EntryStore(object):
+    """
+    A local store of time entry dictionaries keyed by id, persisted as a
+    JSON file.
+    Properties:
+        entries - dictionary of entry id to time entry dictionary.
+        watermark - the newest 'at' (last modified) timestamp seen, or None.
+    """
+
+    def __init__(self, path=None):
+        """
+        path(str) is the file to persist the store in. Defaults to a
+        per-account file in the pytoggl cache directory.
+        """
+        if path is None:
+            path = account_file('sync')
+        self.path = path
+        self.entries = {}
+        self.watermark = None
+        self.load()
+
+    def load(self):
+        """
+        Reads the store from disk. A missing, unreadable or old-version file
+        leaves the store empty.
+        """
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (IOError, ValueError):
+            return
+        if stored.get('version') != STORE_VERSION:
+            return
+        self.entries = dict((entry['id'], entry) for entry in stored['entries'])
+        self.watermark = stored['watermark']
+
+    def save(self):
+        """
+        Writes the store to disk.
+        """
+        write_json_atomic(self.path, {
+            'version': STORE_VERSION,
+            'watermark': self.watermark,
+            'entries': self.entries.values(),
+        })
+
+#----------------------------------------------------------------------------
+# SyncResult
+#----------------------------------------------------------------------------
+class SyncResult(object):
+    """
+    The changes found by one TimeEntrySync.sync() call.
+    Properties:
+        added - list of TimeEntry objects new since the last sync.
+        updated - list of TimeEntry objects modified since the last sync.
+        deleted - list of TimeEntry objects (as last stored) that no longer
+          exist on the server.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.deleted = []
+
+    def __nonzero__(self):
+        """
+        True if anything changed.
+        """
+        return bool(self.added or self.updated or self.deleted)
+
+    def __str__(self):
+        return "%d added, %d updated, %d deleted" % \
+            (len(self.added), len(self.updated), len(self.deleted))
+
+#----------------------------------------------------------------------------
+# TimeEntrySync
+#----------------------------------------------------------------------------
+class TimeEntrySync(object):
+    """
+    Detects time entry changes since the last sync.
+
+    toggl can't be asked for entries by modification time, so each sync
+    fetches the entries that started within the last `lookback` and
+    compares them with the store. Changes to entries that started before
+    the lookback window are not detected.
+    """
+
+    def __init__(self, store=None, lookback=datetime.timedelta(days=9), client=None):
+        """
+        * store is an optional EntryStore. Defaults to the per-account store.
+        * lookback(timedelta) is how far back to look for changed entries.
+        * client is an optional TogglClient to sync; by default the account
+          configured in ~/.togglrc is used.
+        """
+        self.client = client or DefaultClient()
+        if store is None:
+            store = EntryStore(client.account_file('sync') if client else None)
+        self.store = store
+        self.lookback = lookback
+
+    def sync(self, now=None):
+        """
+        Fetches the lookback window, updates and saves the store, and returns
+        a SyncResult describing the changes. now is an optional localized
+        datetime to sync up to.
+        """
+        if now is None:
+            now = self.client.date_and_time().now()
+        window_start = now - self.lookback
+        window_end = now + datetime.timedelta(days=1)
+        watermark = self._parse(self.store.watermark)
+
+        result = SyncResult()
+        seen = set()
+        newest = watermark
+        for entry in iter_time_entries(window_start, window_end, client=self.client):
+            entry_id = entry.get('id')
+            seen.add(entry_id)
+            at = self._parse(entry.get('at'))
+            if newest is None or (at is not None and at > newest):
+                newest = at
+
+            stored = self.store.entries.get(entry_id)
+            if stored is None:
+                result.added.append(entry)
+            elif (at is not None and watermark is not None and at <= watermark):
+                # Not modified since the last sync.
+                continue
+            elif stored.get('at') != entry.get('at'):
+                result.updated.append(entry)
+            else:
+                continue
+            self.store.entries[entry_id] = entry.data
+
+        for entry_id, stored in self.store.entries.items():
+            if entry_id in seen:
+                continue
+            start_time = self._parse(stored.get('start'))
+            if start_time is not None and window_start <= start_time <= window_end:
+                result.deleted.append(TimeEntry(data_dict=stored, client=self.client))
+                del self.store.entries[entry_id]
+
+        if newest is not None:
+            self.store.watermark = newest.isoformat()
+        self.store.save()
+        return result
+
+    def _parse(self, iso_str):
+        if not iso_str:
+            return None
+        return self.client.date_and_time().parse_iso_str(iso_str)
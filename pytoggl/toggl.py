@@ -14,7 +14,7 @@ ASCII art from http://patorjk.com/software/taag/#p=display&c=bash&f=Standard
 #   2. Toggl Models - Toggl-specific data classes
 #   3. Command Line Interface - CLI
 
-#import datetime
+import datetime
 #import dateutil.parser
 #import iso8601
 import json
@@ -23,12 +23,19 @@ import json
 #import pytz
 #import requests
 #import sys
-#import time
+import time
 import urllib
+import uuid
 
-from .utility import Singleton, Config, DateAndTime, Logger, httpexec
+from . import journal
+from .cache import account_file, cached_get, cached_get_json, data_root
+from .state import RunningEntryState
+from .utility import Singleton, Config, DateAndTime, DefaultTransport, Logger, NameIndex, \
+    TogglConnectionError, TogglError, TogglHTTPError, WorkerPool, httpexec
 
 TOGGL_URL = "https://www.toggl.com/api/v8"
+MAX_ENTRIES_PER_REQUEST = 1000 # toggl truncates larger time entry responses
+BULK_BATCH_SIZE = 100 # ids per bulk change request, keeping URLs short
 VERBOSE = False # verbose output?
 
 #############################################################################
@@ -52,12 +59,50 @@ class ClientList(object):
 
     __metaclass__ = Singleton
 
-    def __init__(self):
+    def __init__(self, client=None):
+        """
+        Fetches the list of clients from toggl, or from the local cache.
+        client is an optional TogglClient to fetch through; by default the
+        account configured in ~/.togglrc is used.
+        """
+        self.client = client or DefaultClient()
+        self.url = "%s/clients" % self.client.url
+        self.refreshed = False
+        self._load()
+
+    def find_by_id(self, cid):
+        """
+        Returns the client object with the given id, or None.
+        """
+        return self._find(lambda: self.index.find_by_id(cid))
+
+    def find_by_name(self, name_prefix, strict=False):
         """
-        Fetches the list of clients from toggl.
+        Returns the client object with the given name (or prefix), or None.
+        See NameIndex.find_by_name() for how prefixes are resolved.
         """
-        result = httpexec("%s/clients" % TOGGL_URL, 'get')
-        self.client_list = json.loads(result)
+        return self._find(lambda: self.index.find_by_name(name_prefix, strict))
+
+    def refresh(self):
+        """
+        Revalidates the cached list with toggl, picking up clients added
+        since it was cached.
+        """
+        self._load(refresh=True)
+        self.refreshed = True
+
+    def _find(self, lookup):
+        # A miss may just mean the cached list is out of date; revalidate
+        # it once before giving up.
+        result = lookup()
+        if not result and not self.refreshed:
+            self.refresh()
+            result = lookup()
+        return result
+
+    def _load(self, refresh=False):
+        self.client_list = self.client.cached_get_json(self.url, refresh=refresh)
+        self.index = NameIndex(self.client_list, 'Client')
 
     def __iter__(self):
         """
@@ -80,10 +125,7 @@ class ClientList(object):
         """
         Formats the list of clients as a string.
         """
-        s = ""
-        for client in self.client_list:
-            s = s + "%s\n" % client['name']
-        return s.rstrip() # strip trailing \n
+        return "\n".join(client['name'] for client in self.client_list)
 
 #----------------------------------------------------------------------------
 # ProjectList
@@ -97,30 +139,59 @@ class ProjectList(object):
 
     __metaclass__ = Singleton
 
-    def __init__(self):
+    def __init__(self, client=None):
         """
-        Fetches the list of projects from toggl.
+        Fetches the list of projects from toggl, or from the local cache.
+        client is an optional TogglClient to fetch through; by default the
+        account configured in ~/.togglrc is used.
         """
-        result = httpexec("%s/workspaces/%s/projects" % (TOGGL_URL, User().get('default_wid')), 'get')
-        self.project_list = json.loads(result)
+        self.client = client or DefaultClient()
+        self.url = "%s/workspaces/%s/projects" % (self.client.url, self.client.workspace_id())
+        self.refreshed = False
+        self._load()
+
+    def find_all_by_prefix(self, name_prefix):
+        """
+        Returns the list of project objects whose name starts with
+        name_prefix, sorted by name.
+        """
+        return self._find(lambda: self.index.find_all_by_prefix(name_prefix))
 
     def find_by_id(self, pid):
         """
         Returns the project object with the given id, or None.
         """
-        for project in self:
-            if project['id'] == pid:
-                return project
-        return None
+        return self._find(lambda: self.index.find_by_id(pid))
 
-    def find_by_name(self, name_prefix):
+    def find_by_name(self, name_prefix, strict=False):
         """
         Returns the project object with the given name (or prefix), or None.
+        An exact name match always wins; otherwise the alphabetically first
+        match is returned. If strict is True, an ambiguous prefix raises a
+        RuntimeError listing the candidates instead.
         """
-        for project in self:
-            if project['name'].startswith(name_prefix):
-                return project
-        return None
+        return self._find(lambda: self.index.find_by_name(name_prefix, strict))
+
+    def refresh(self):
+        """
+        Revalidates the cached list with toggl, picking up projects added
+        since it was cached.
+        """
+        self._load(refresh=True)
+        self.refreshed = True
+
+    def _find(self, lookup):
+        # A miss may just mean the cached list is out of date; revalidate
+        # it once before giving up.
+        result = lookup()
+        if not result and not self.refreshed:
+            self.refresh()
+            result = lookup()
+        return result
+
+    def _load(self, refresh=False):
+        self.project_list = self.client.cached_get_json(self.url, refresh=refresh)
+        self.index = NameIndex(self.project_list, 'Project')
 
     def __iter__(self):
         """
@@ -139,23 +210,86 @@ class ProjectList(object):
             self.iter_index += 1
             return self.project_list[self.iter_index-1]
 
+    def projects_with_clients(self):
+        """
+        Yields a (project, client) pair for every project, where client is
+        the project's client object or None. Clients are looked up through
+        the ClientList id index, so this is linear in the number of projects.
+        """
+        clients = None
+        for project in self.project_list:
+            client = None
+            if project.get('cid') is not None:
+                if clients is None:
+                    clients = self.client.clients()
+                client = clients.find_by_id(project['cid'])
+            yield project, client
+
     def __str__(self):
         """Formats the project list as a string."""
-        s = ""
-        clients = ClientList()
-        for project in self:
-            client_name = ''
-            if 'cid' in project:
-               for client in clients:
-                   if project['cid'] == client['id']:
-                       client_name = " - %s" % client['name']
-            s = s + "@%s%s\n" % (project['name'], client_name)
-        return s.rstrip() # strip trailing \n
+        lines = []
+        for project, client in self.projects_with_clients():
+            if client is not None:
+                lines.append("@%s - %s" % (project['name'], client['name']))
+            else:
+                lines.append("@%s" % project['name'])
+        return "\n".join(lines)
+
+#----------------------------------------------------------------------------
+# TimeEntryBase
+#----------------------------------------------------------------------------
+class TimeEntryBase(object):
+    """
+    Behaviour shared by TimeEntry and CompactTimeEntry. Subclasses provide
+    get(), has() and set(), and a client attribute.
+    """
+
+    __slots__ = ()
+
+    def normalized_duration(self):
+        """
+        Returns a "normalized" duration. If the native duration is positive,
+        it is simply returned. If negative, we return current_time + duration
+        (the actual amount of seconds this entry has been running). If no
+        duration is set, raises an exception.
+        """
+        duration = self.get('duration')
+        if duration is None:
+            raise Exception('Time entry has no "duration" property')
+        if duration > 0:
+            return int(duration)
+        else:
+            return time.time() + int(duration)
+
+    def __str__(self):
+        """
+        Returns a human-friendly string representation of this time entry.
+        """
+        if self.get('duration') > 0:
+            is_running = '  '
+        else:
+            is_running = '* '
+
+        if self.has('pid'):
+            project = self.client.projects().find_by_id(self.get('pid'))
+            # The project may have been deleted, or be in another workspace.
+            project_name = " @%s " % (project['name'] if project is not None else self.get('pid'))
+        else:
+            project_name = " "
+
+        s = "%s%s%s%s" % (is_running, self.get('description'), project_name,
+            self.client.date_and_time().elapsed_time(int(self.normalized_duration())) \
+        )
+
+        if VERBOSE:
+            s += " [%s]" % self.get('id')
+
+        return s
 
 #----------------------------------------------------------------------------
 # TimeEntry
 #----------------------------------------------------------------------------
-class TimeEntry(object):
+class TimeEntry(TimeEntryBase):
     """
     Represents a single time entry.
 
@@ -164,7 +298,7 @@ class TimeEntry(object):
     to be in UTC.
     """
 
-    def __init__(self, description=None, start_time=None, stop_time=None, duration=None, project_name=None, data_dict=None):
+    def __init__(self, description=None, start_time=None, stop_time=None, duration=None, project_name=None, data_dict=None, client=None):
         """
         Constructor. None of the parameters are required at object creation,
         but the object is validated before data is sent to toggl.
@@ -177,7 +311,10 @@ class TimeEntry(object):
         * data_dict is an optional dictionary created from a JSON-encoded time
           entry from toggl. If this parameter is used to initialize the object,
           its values will supercede any other constructor parameters.
+        * client is an optional TogglClient this entry belongs to; by default
+          the account configured in ~/.togglrc is used.
         """
+        self.client = client or DefaultClient()
 
         # All toggl data is stored in the "data" dictionary.
         self.data = {}
@@ -192,7 +329,7 @@ class TimeEntry(object):
             self.data['stop'] = stop_time.isoformat()
 
         if project_name is not None:
-            project = ProjectList().find_by_name(project_name)
+            project = self.client.projects().find_by_name(project_name, strict=True)
             if project == None:
                 raise RuntimeError("Project '%s' not found." % project_name)
             self.data['pid'] = project['id']
@@ -210,20 +347,23 @@ class TimeEntry(object):
         """
         Adds this time entry as a completed entry.
         """
+        self._set_guid()
         self.validate()
-        httpexec("%s/time_entries" % TOGGL_URL, "post", self.json())
+        self._send("post", "/time_entries")
 
     def continue_entry(self):
         """
         Continues an existing entry.
         """
+        dt = self.client.date_and_time()
+
         # Was the entry started today or earlier than today?
-        start_time = DateAndTime().parse_iso_str( self.get('start') )
+        start_time = dt.parse_iso_str( self.get('start') )
 
-        if start_time <= DateAndTime().start_of_today():
+        if start_time <= dt.start_of_today():
             # Entry was from a previous day. Create a new entry from this
             # one, resetting any identifiers or time data.
-            new_entry = TimeEntry()
+            new_entry = TimeEntry(client=self.client)
             new_entry.data = self.data.copy()
             new_entry.set('at', None)
             new_entry.set('created_with', 'toggl-cli')
@@ -238,11 +378,13 @@ class TimeEntry(object):
         else:
             # To continue an entry from today, set duration to
             # 0 - (current_time - duration).
-            now = DateAndTime().duration_since_epoch( DateAndTime().now() )
+            now = dt.duration_since_epoch( dt.now() )
             self.data['duration'] = 0 - (now - int(self.data['duration']))
             self.data['duronly'] = True # ignore start/stop times from now on
 
-            httpexec("%s/time_entries/%s" % (TOGGL_URL, self.data['id']), 'put', data=self.json())
+            self._send('put', "/time_entries/%s" % self._id_path(),
+                       fields=('duration', 'duronly'))
+            self.client.running_state().set(self.data)
 
             Logger.debug('Continuing entry %s' % self.json())
 
@@ -250,11 +392,11 @@ class TimeEntry(object):
         """
         Deletes this time entry from the server.
         """
-        if not self.has('id'):
+        if not self.has('id') and not self.has('guid'):
             raise Exception("Time entry must have an id to be deleted.")
 
-        url = "%s/time_entries/%s" % (TOGGL_URL, self.get('id'))
-        httpexec(url, 'delete')
+        self._send('delete', "/time_entries/%s" % self._id_path(), send_body=False)
+        self.client.running_state().remove(self.data)
 
     def get(self, prop):
         """
@@ -280,20 +422,6 @@ class TimeEntry(object):
         """
         return '{"time_entry": %s}' % json.dumps(self.data)
 
-    def normalized_duration(self):
-        """
-        Returns a "normalized" duration. If the native duration is positive,
-        it is simply returned. If negative, we return current_time + duration
-        (the actual amount of seconds this entry has been running). If no
-        duration is set, raises an exception.
-        """
-        if 'duration' not in self.data:
-            raise Exception('Time entry has no "duration" property')
-        if self.data['duration'] > 0:
-            return int(self.data['duration'])
-        else:
-            return time.time() + int(self.data['duration'])
-
     def set(self, prop, value):
         """
         Sets the given toggl time entry property to the given value. If
@@ -312,20 +440,26 @@ class TimeEntry(object):
         a start time yet, it is set to now. duration is set to
         0-start_time.
         """
+        dt = self.client.date_and_time()
+        self._set_guid()
         if self.has('start'):
-            start_time = DateAndTime().parse_iso_str(self.get('start'))
-            self.set('duration', 0-DateAndTime().duration_since_epoch(start_time))
+            start_time = dt.parse_iso_str(self.get('start'))
+            self.set('duration', 0-dt.duration_since_epoch(start_time))
 
             self.validate()
 
-            httpexec("%s/time_entries" % TOGGL_URL, "post", self.json())
+            self._send("post", "/time_entries")
         else:
             # 'start' is ignored by 'time_entries/start' endpoint. We define it
-            # to keep consinstency with toggl server
-            self.data['start'] = DateAndTime().now().isoformat()
+            # to keep consinstency with toggl server, and so that a queued
+            # start can be replayed with the right start time.
+            start_time = dt.now()
+            self.data['start'] = start_time.isoformat()
+            self.set('duration', 0-dt.duration_since_epoch(start_time))
 
-            httpexec("%s/time_entries/start" % TOGGL_URL, "post", self.json())
+            self._send("post", "/time_entries/start", queued_path="/time_entries")
 
+        self.client.running_state().set(self.data)
         Logger.debug('Started time entry: %s' % self.json())
 
     def stop(self, stop_time=None):
@@ -339,39 +473,56 @@ class TimeEntry(object):
         self.validate()
         if int(self.data['duration']) >= 0:
             raise Exception("toggl: time entry is not currently running.")
-        if 'id' not in self.data:
+        if not self.has('id') and not self.has('guid'):
             raise Exception("toggl: time entry must have an id.")
 
+        dt = self.client.date_and_time()
         if stop_time is None:
-            stop_time = DateAndTime().now()
+            stop_time = dt.now()
         self.set('stop', stop_time.isoformat())
         self.set('duration', \
-            DateAndTime().duration_since_epoch(stop_time) + int(self.get('duration')))
-
-        httpexec("%s/time_entries/%d" % (TOGGL_URL, self.get('id')), 'put', self.json())
-
-    def __str__(self):
+            dt.duration_since_epoch(stop_time) + int(self.get('duration')))
+
+        # Only the stop is sent, so changes made elsewhere (e.g. to the
+        # description in the web app) aren't overwritten.
+        self._send('put', "/time_entries/%s" % self._id_path(),
+                   fields=('stop', 'duration'))
+        self.client.running_state().remove(self.data)
+
+    def _id_path(self):
+        # The id of an entry whose create is still queued isn't known yet;
+        # the journal fills it in on replay.
+        if not self.has('id') and self.has('guid'):
+            self.set('id', self.client.journal().id_for(self.get('guid')))
+        if self.has('id'):
+            return self.get('id')
+        return journal.ID_PLACEHOLDER
+
+    def _send(self, method, path, send_body=True, queued_path=None, fields=None):
         """
-        Returns a human-friendly string representation of this time entry.
+        Sends a change to this entry to toggl through the client's journal,
+        which queues the change if it can't be sent now. Records the id
+        toggl assigns to a new entry. fields is an optional list of the
+        properties to send; by default the whole entry is sent.
         """
-        if self.data['duration'] > 0:
-            is_running = '  '
-        else:
-            is_running = '* '
-
-        if 'pid' in self.data:
-            project_name = " @%s " % ProjectList().find_by_id(self.data['pid'])['name']
+        if not send_body:
+            data = None
+        elif fields is not None:
+            data = json.dumps({'time_entry': dict((field, self.get(field)) for field in fields)})
         else:
-            project_name = " "
-
-        s = "%s%s%s%s" % (is_running, self.data['description'], project_name,
-            DateAndTime().elapsed_time(int(self.normalized_duration())) \
-        )
-
-        if VERBOSE:
-            s += " [%s]" % self.data['id']
-
-        return s
+            data = self.json()
+        response = self.client.journal().send(method, path,
+            data=data,
+            guid=self.get('guid'),
+            ref=self.get('guid') if journal.ID_PLACEHOLDER in path else None,
+            queued_path=queued_path)
+        if isinstance(response, dict) and isinstance(response.get('data'), dict) \
+                and not self.has('id'):
+            self.set('id', response['data'].get('id'))
+
+    def _set_guid(self):
+        if not self.has('guid'):
+            self.set('guid', str(uuid.uuid4()))
 
     def validate(self):
         """
@@ -388,20 +539,124 @@ class TimeEntry(object):
                 raise Exception("toggl: time entries must have a '%s' property." % prop)
         return True
 
+#----------------------------------------------------------------------------
+# CompactTimeEntry
+#----------------------------------------------------------------------------
+class CompactTimeEntry(TimeEntryBase):
+    """
+    A memory-compact time entry for reading large histories. Known toggl
+    properties are stored in slots instead of a per-entry dictionary; any
+    other properties go in a small overflow dictionary.
+
+    It supports the same get(), has(), set() and json() calls as TimeEntry.
+    To start, stop, continue or delete the entry, convert it with
+    to_time_entry() first.
+    """
+
+    FIELDS = ('id', 'guid', 'wid', 'pid', 'tid', 'uid', 'billable', 'start',
+              'stop', 'duration', 'duronly', 'description', 'tags', 'at',
+              'created_with')
+
+    __slots__ = FIELDS + ('extra', 'client')
+
+    def __init__(self, data_dict, client=None):
+        """
+        * data_dict is a dictionary created from a JSON-encoded time entry
+          from toggl.
+        * client is an optional TogglClient this entry belongs to.
+        """
+        self.client = client or DefaultClient()
+        self.extra = None
+        for prop, value in data_dict.iteritems():
+            self.set(prop, value)
+
+    @property
+    def data(self):
+        """
+        A dictionary copy of this entry's properties. Changes to it are not
+        reflected in the entry; use set() instead.
+        """
+        data = {}
+        for prop in self.FIELDS:
+            value = getattr(self, prop, None)
+            if value is not None:
+                data[prop] = value
+        if self.extra:
+            data.update(self.extra)
+        if 'tags' in data:
+            data['tags'] = list(data['tags'])
+        return data
+
+    def get(self, prop):
+        """
+        Returns the given toggl time entry property, or None if it isn't set.
+        """
+        if prop in self.FIELDS:
+            return getattr(self, prop, None)
+        if self.extra:
+            return self.extra.get(prop)
+        return None
+
+    def has(self, prop):
+        """
+        Returns True if this time entry has the given property and it's not
+        None, False otherwise.
+        """
+        return self.get(prop) is not None
+
+    def json(self):
+        """
+        Returns a JSON dump of this entire object as toggl payload.
+        """
+        return '{"time_entry": %s}' % json.dumps(self.data)
+
+    def set(self, prop, value):
+        """
+        Sets the given toggl time entry property to the given value. If
+        value is None, the property is removed from this time entry.
+        """
+        if prop in self.FIELDS:
+            if prop == 'tags' and value is not None:
+                value = tuple(value)
+            if value is not None:
+                setattr(self, prop, value)
+            elif hasattr(self, prop):
+                delattr(self, prop)
+        elif value is not None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[prop] = value
+        elif self.extra and prop in self.extra:
+            del self.extra[prop]
+
+    def to_time_entry(self):
+        """
+        Returns an editable TimeEntry with the same properties.
+        """
+        return TimeEntry(data_dict=self.data, client=self.client)
+
 #----------------------------------------------------------------------------
 # TimeEntryList
 #----------------------------------------------------------------------------
 class TimeEntryList(object):
     """
-    A singleton list of recent TimeEntry objects.
+    A singleton list of recent TimeEntry objects, in order of start time.
+
+    The entries are indexed by id, description and project, and the running
+    entry is tracked, so lookups don't scan the list. The indexes are kept
+    up to date by add(), remove(), reload() and the bulk changes; an entry
+    changed by other means can be reindexed by removing and re-adding it.
     """
 
     __metaclass__ = Singleton
 
-    def __init__(self):
+    def __init__(self, client=None):
         """
-        Fetches time entry data from toggl.
+        Fetches time entry data from toggl. client is an optional TogglClient
+        to fetch through; by default the account configured in ~/.togglrc
+        is used.
         """
+        self.client = client or DefaultClient()
         self.reload()
 
     def __iter__(self):
@@ -411,6 +666,32 @@ class TimeEntryList(object):
         self.iter_index = 0
         return self
 
+    def add(self, entry):
+        """
+        Adds a TimeEntry to the list (not to toggl), in order of start time.
+        """
+        self._insert(self.time_entries, entry)
+        self._index(entry)
+
+    def delete_many(self, ids, workers=8):
+        """
+        Deletes the time entries with the given ids, and removes them from
+        this list. Returns a BulkResult; see delete_time_entries().
+        """
+        result = delete_time_entries(ids, client=self.client, workers=workers)
+        for entry_id in result.succeeded:
+            entry = self.by_id.get(entry_id)
+            if entry is not None:
+                self.remove(entry)
+        return result
+
+    def find_all_by_description(self, description):
+        """
+        Returns the list of entries with the given description, most recent
+        first.
+        """
+        return list(reversed(self.by_description.get(description, [])))
+
     def find_by_description(self, description):
         """
         Searches the list of entries for the one matching the given
@@ -418,10 +699,21 @@ class TimeEntryList(object):
         with a matching description, the most recent one is
         returned.
         """
-        for entry in reversed(self.time_entries):
-            if entry.get('description') == description:
-                return entry
-        return None
+        entries = self.by_description.get(description)
+        return entries[-1] if entries else None
+
+    def find_by_id(self, entry_id):
+        """
+        Returns the entry with the given id, or None.
+        """
+        return self.by_id.get(entry_id)
+
+    def find_by_project(self, pid):
+        """
+        Returns the list of entries in the project with the given id (None
+        for entries without a project), most recent first.
+        """
+        return list(reversed(self.by_project.get(pid, [])))
 
     def next(self):
         """
@@ -437,10 +729,9 @@ class TimeEntryList(object):
         """
         Returns the current time entry object or None.
         """
-        for entry in self:
-            if int(entry.get('duration')) < 0:
-                return entry
-        return None
+        if self.running is not None and int(self.running.get('duration')) >= 0:
+            self.running = None # stopped since it was indexed
+        return self.running
 
     def reload(self):
         """
@@ -448,32 +739,49 @@ class TimeEntryList(object):
         method chaining.
         """
         # Fetch time entries from 00:00:00 yesterday to 23:59:59 today.
-        url = "%s/time_entries?start_date=%s&end_date=%s" % \
-            (TOGGL_URL, urllib.quote(DateAndTime().start_of_yesterday().isoformat('T')), \
-            urllib.quote(DateAndTime().last_minute_today().isoformat('T')))
-        Logger.debug(url)
-        entries = json.loads( httpexec(url, 'get') )
-
-        # Build a list of entries.
         self.time_entries = []
-        for entry in entries:
-            te = TimeEntry(data_dict=entry)
-            Logger.debug(te.json())
-            Logger.debug('---')
+        self.by_id = {}
+        self.by_description = {} # description -> entries, oldest first
+        self.by_project = {} # pid -> entries, oldest first
+        self.running = None
+        dt = self.client.date_and_time()
+        start_time = dt.start_of_yesterday()
+        state = self.client.running_state()
+        for te in iter_time_entries(start_time, dt.last_minute_today(),
+                                    client=self.client):
+            if Logger.level >= Logger.DEBUG:
+                Logger.debug(te.json())
+                Logger.debug('---')
             self.time_entries.append(te)
-
-        # Sort the list by start time.
-        sorted(self.time_entries, key=lambda entry: entry.data['start'])
+            self._index(te)
+            if self.running is te:
+                state.set(te.data)
+
+        # Nothing is running, unless the recorded entry started before the
+        # fetched range or is still queued in the journal.
+        if self.running is None and not self.client.journal().pending():
+            record = state.get(float('inf'))
+            entry = record['entry'] if record is not None else None
+            if entry is None or dt.parse_iso_str(entry['start']) >= start_time:
+                state.set(None)
         return self
 
+    def remove(self, entry):
+        """
+        Removes a TimeEntry from the list (not from toggl).
+        """
+        self.time_entries.remove(entry)
+        self._unindex(entry)
+
     def __str__(self):
         """
         Returns a human-friendly list of recent time entries.
         """
         # Sort the time entries into buckets based on "Month Day" of the entry.
+        dt = self.client.date_and_time()
         days = { }
         for entry in self.time_entries:
-            start_time = DateAndTime().parse_iso_str(entry.get('start')).strftime("%Y-%m-%d")
+            start_time = dt.parse_iso_str(entry.get('start')).strftime("%Y-%m-%d")
             if start_time not in days:
                 days[start_time] = []
                 days[start_time].append(entry)
@@ -486,10 +794,277 @@ class TimeEntryList(object):
             for entry in days[date]:
                 s += str(entry) + "\n"
                 duration += entry.normalized_duration()
-                s += "  (%s)\n" % DateAndTime().elapsed_time(int(duration))
+                s += "  (%s)\n" % dt.elapsed_time(int(duration))
 
         return s.rstrip() # strip trailing \n
 
+    def update_many(self, ids, fields, workers=8):
+        """
+        Sets the given fields on the time entries with the given ids, and
+        updates the matching entries in this list. Returns a BulkResult;
+        see update_time_entries().
+        """
+        result = update_time_entries(ids, fields, client=self.client, workers=workers)
+        returned = dict((data.get('id'), data) for data in result.entries)
+        for entry_id in result.succeeded:
+            entry = self.by_id.get(entry_id)
+            if entry is None:
+                continue
+            self._unindex(entry)
+            if entry_id in returned:
+                entry.data = returned[entry_id]
+            else:
+                _apply_fields(entry.data, fields) # queued in the journal
+            self._index(entry)
+        return result
+
+    def _index(self, entry):
+        if entry.has('id'):
+            self.by_id[entry.get('id')] = entry
+        # An entry still being built may have no start or duration yet. One
+        # without a start can't be ordered, so it is only indexed by id.
+        if entry.has('start'):
+            self._insert(self.by_description.setdefault(entry.get('description'), []), entry)
+            self._insert(self.by_project.setdefault(entry.get('pid'), []), entry)
+        if entry.has('duration') and int(entry.get('duration')) < 0:
+            self.running = entry
+
+    def _insert(self, entries, entry):
+        # Entries almost always arrive in order of start time, so the insert
+        # position is found by walking back from the end.
+        start = self._start_epoch(entry)
+        i = len(entries)
+        while i > 0 and self._start_epoch(entries[i-1]) > start:
+            i -= 1
+        entries.insert(i, entry)
+
+    def _start_epoch(self, entry):
+        # Entries without a start time sort last.
+        if not entry.has('start'):
+            return float('inf')
+        return self.client.date_and_time().parse_iso_epoch(entry.get('start'))
+
+    def _unindex(self, entry):
+        if self.by_id.get(entry.get('id')) is entry:
+            del self.by_id[entry.get('id')]
+        for index, key in ((self.by_description, entry.get('description')),
+                           (self.by_project, entry.get('pid'))):
+            entries = index.get(key, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                index.pop(key, None)
+        if self.running is entry:
+            self.running = None
+
+#----------------------------------------------------------------------------
+# iter_time_entries
+#----------------------------------------------------------------------------
+def iter_time_entries(start_time, end_time, window=datetime.timedelta(days=7), compact=False, client=None):
+    """
+    Lazily yields the TimeEntry objects that started between the given
+    localized datetimes, in order of start time. If compact is True,
+    CompactTimeEntry objects are yielded instead. client is an optional
+    TogglClient to fetch through.
+
+    The range is fetched one window at a time and each response is decoded
+    as it streams in, so entries are yielded as they arrive and only one
+    entry is held in memory at a time. Stopping early skips the remaining
+    requests. If a window hits toggl's response size limit, the window is
+    fetched again from the start time of the last entry received.
+    """
+    client = client or DefaultClient()
+    if compact:
+        make_entry = lambda entry: CompactTimeEntry(entry, client=client)
+    else:
+        make_entry = lambda entry: TimeEntry(data_dict=entry, client=client)
+    previous_ids = set()
+    window_start = start_time
+    while window_start < end_time:
+        window_end = min(window_start + window, end_time)
+
+        # Entries starting exactly on a window boundary are returned by both
+        # requests; only yield them once.
+        ids = set()
+        last_start = None
+        for entry in _iter_time_entries_json(client, window_start, window_end):
+            ids.add(entry['id'])
+            last_start = entry['start']
+            if entry['id'] not in previous_ids:
+                yield make_entry(entry)
+        previous_ids = ids
+
+        if len(ids) >= MAX_ENTRIES_PER_REQUEST:
+            resume_start = client.date_and_time().parse_iso_str(last_start)
+            if resume_start > window_start:
+                window_start = resume_start
+                continue
+            Logger.info("More than %d time entries start at %s; some were skipped." % \
+                (MAX_ENTRIES_PER_REQUEST, last_start))
+        window_start = window_end
+
+def _iter_time_entries_json(client, start_time, end_time):
+    """
+    Yields the time entry dictionaries that started between the given
+    localized datetimes, as they are received.
+    """
+    url = "%s/time_entries?start_date=%s&end_date=%s" % \
+        (client.url, urllib.quote(start_time.isoformat('T')), \
+        urllib.quote(end_time.isoformat('T')))
+    Logger.debug(url)
+    return client.iter_json(url)
+
+def current_time_entry(client=None, max_age=None):
+    """
+    Returns the running TimeEntry, or None. The local running entry state
+    answers without a request while it is fresh (see pytoggl.state);
+    otherwise toggl is asked and the state updated. max_age overrides the
+    number of seconds the state is trusted for.
+
+    The local state is also used, however old, while changes are queued in
+    the journal or toggl can't be reached.
+    """
+    client = client or DefaultClient()
+    state = client.running_state()
+    record = state.get(max_age)
+    if record is None and not client.journal().pending():
+        try:
+            result = json.loads(client.httpexec("%s/time_entries/current" % client.url, 'get'))
+        except TogglConnectionError:
+            if state.get(float('inf')) is None:
+                raise
+        else:
+            state.set(result.get('data'))
+    if record is None:
+        record = state.get(float('inf'))
+
+    if record is None or record['entry'] is None:
+        return None
+    return TimeEntry(data_dict=record['entry'], client=client)
+
+#----------------------------------------------------------------------------
+# BulkResult
+#----------------------------------------------------------------------------
+class BulkResult(object):
+    """
+    The outcome of a bulk change to time entries.
+    Properties:
+        succeeded - list of ids of the entries changed, or queued in the
+          journal to be.
+        failed - dictionary of id to the TogglError for each entry that
+          could not be changed.
+        entries - list of the changed entry dictionaries toggl returned.
+          Always empty for deletes, and for changes that were queued.
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = {}
+        self.entries = []
+
+    def __str__(self):
+        return "%d changed, %d failed" % (len(self.succeeded), len(self.failed))
+
+    def _add(self, ids, response):
+        self.succeeded.extend(ids)
+        data = response.get('data') if isinstance(response, dict) else None
+        if isinstance(data, dict):
+            data = [data]
+        if isinstance(data, list):
+            self.entries.extend(data)
+
+#----------------------------------------------------------------------------
+# Bulk changes
+#----------------------------------------------------------------------------
+def delete_time_entries(ids, client=None, workers=8):
+    """
+    Deletes the time entries with the given ids. client is an optional
+    TogglClient to delete through. Returns a BulkResult.
+
+    toggl has no bulk delete, so the entries are deleted one request each,
+    with up to `workers` requests in flight. Changes that can't reach toggl
+    are queued in the journal, as with single entries.
+    """
+    client = client or DefaultClient()
+    result = BulkResult()
+    _change_one_by_one(client, 'delete', [int(entry_id) for entry_id in ids], None, workers, result)
+    state = client.running_state()
+    for entry_id in result.succeeded:
+        state.remove({'id': entry_id})
+    return result
+
+def update_time_entries(ids, fields, client=None, workers=8):
+    """
+    Sets fields, a dictionary of time entry properties, on the time entries
+    with the given ids, e.g. {'pid': 123} to move them to another project,
+    or {'tags': ['billed'], 'tag_action': 'add'} to add a tag ('remove'
+    removes it). client is an optional TogglClient to update through.
+    Returns a BulkResult.
+
+    Up to BULK_BATCH_SIZE entries are updated per request, using toggl's
+    comma-separated ids. If toggl answers a batch with 403 or 404 (one of
+    its entries doesn't exist or isn't yours), its entries are updated one
+    at a time instead, as by delete_time_entries(). Any other rejection,
+    e.g. of an invalid field, fails the whole batch.
+    """
+    client = client or DefaultClient()
+    data = json.dumps({'time_entry': fields})
+    result = BulkResult()
+    ids = [int(entry_id) for entry_id in ids]
+    one_by_one = []
+    for i in range(0, len(ids), BULK_BATCH_SIZE):
+        batch = ids[i:i + BULK_BATCH_SIZE]
+        try:
+            result._add(batch, _send_change(client, 'put', batch, data))
+        except TogglHTTPError, e:
+            if len(batch) > 1 and e.status_code in (403, 404):
+                one_by_one.extend(batch)
+            else:
+                for entry_id in batch:
+                    result.failed[entry_id] = e
+    _change_one_by_one(client, 'put', one_by_one, data, workers, result)
+    return result
+
+def _apply_fields(data, fields):
+    # Mirrors a bulk update on a local entry dictionary.
+    fields = dict(fields)
+    tag_action = fields.pop('tag_action', None)
+    if tag_action is not None and 'tags' in fields:
+        tags = data.get('tags') or []
+        if tag_action == 'add':
+            fields['tags'] = tags + [tag for tag in fields['tags'] if tag not in tags]
+        else:
+            fields['tags'] = [tag for tag in tags if tag not in fields['tags']]
+    data.update(fields)
+
+def _change_one_by_one(client, method, ids, data, workers, result):
+    """
+    Sends a change to each of the entries with the given ids concurrently,
+    adding the outcomes to result.
+    """
+    if not ids:
+        return
+    pool = WorkerPool(min(workers, len(ids)))
+    try:
+        futures = [(entry_id, pool.submit(_send_change, client, method, [entry_id], data))
+                   for entry_id in ids]
+        for entry_id, future in futures:
+            if isinstance(future.exception(), TogglError):
+                result.failed[entry_id] = future.exception()
+            else:
+                result._add([entry_id], future.result())
+    finally:
+        pool.shutdown()
+
+def _send_change(client, method, ids, data):
+    """
+    Sends a change to the time entries with the given ids through the
+    client's journal. Returns the decoded response, or None if the change
+    was queued.
+    """
+    path = "/time_entries/%s" % ",".join(str(entry_id) for entry_id in ids)
+    return client.journal().send(method, path, data)
+
 #----------------------------------------------------------------------------
 # User
 #----------------------------------------------------------------------------
@@ -500,17 +1075,19 @@ class User(object):
 
     __metaclass__ = Singleton
 
-    def __init__(self):
+    def __init__(self, client=None):
         """
-        Fetches user data from toggl.
+        Fetches user data from toggl, or from the local cache. client is an
+        optional TogglClient to fetch through; by default the account
+        configured in ~/.togglrc is used.
         """
-        result = httpexec("%s/me" % TOGGL_URL, 'get')
-        result_dict = json.loads(result)
+        self.client = client or DefaultClient()
+        result_dict = self.client.cached_get_json("%s/me" % self.client.url)
 
         # Results come back in two parts. 'since' is how long the user has
         # had their toggl account. 'data' is a dictionary of all the other
         # user data.
-        self.data = result_dict['data']
+        self.data = dict(result_dict['data'])
         self.data['since'] = result_dict['since']
 
     def get(self, prop):
@@ -519,3 +1096,63 @@ class User(object):
         documented at https://github.com/toggl/toggl_api_docs/blob/master/chapters/users.md
         """
         return self.data[prop]
+
+#----------------------------------------------------------------------------
+# DefaultClient
+#----------------------------------------------------------------------------
+class DefaultClient(object):
+    """
+    Singleton client for the account configured in ~/.togglrc, backed by
+    the process-wide User, ProjectList, ClientList and DateAndTime
+    singletons. The models use it when no TogglClient is given; see
+    pytoggl.client.TogglClient for the interface. Requests go to api_url
+    from the [options] section of ~/.togglrc, or TOGGL_URL.
+    """
+
+    __metaclass__ = Singleton
+
+    @property
+    def url(self):
+        return Config().get_default('options', 'api_url', TOGGL_URL)
+
+    def cached_get(self, url, refresh=False):
+        return cached_get(url, refresh=refresh)
+
+    def cached_get_json(self, url, refresh=False):
+        return cached_get_json(url, refresh=refresh)
+
+    def clients(self):
+        return ClientList()
+
+    def date_and_time(self):
+        return DateAndTime()
+
+    def httpexec(self, url, method, data=None):
+        return httpexec(url, method, data)
+
+    def journal(self):
+        with DefaultClient.instance_lock:
+            if getattr(self, '_journal', None) is None:
+                queue_writes = Config().get_default('options', 'queue_writes', 'false')
+                self._journal = journal.Journal(self, account_file('journal', '.jsonl', data_root()),
+                                                queue_writes=queue_writes.lower() == 'true')
+            return self._journal
+
+    def iter_json(self, url):
+        return DefaultTransport().iter_json(url)
+
+    def running_state(self):
+        with DefaultClient.instance_lock:
+            if getattr(self, '_running_state', None) is None:
+                ttl = Config().get_default('options', 'state_ttl', RunningEntryState.DEFAULT_TTL)
+                self._running_state = RunningEntryState(account_file('state'), ttl)
+            return self._running_state
+
+    def projects(self):
+        return ProjectList()
+
+    def user(self):
+        return User()
+
+    def workspace_id(self):
+        return User().get('default_wid')
@@ -14,18 +14,38 @@ ASCII art from http://patorjk.com/software/taag/#p=display&c=bash&f=Standard
 #   2. Toggl Models - Toggl-specific data classes
 #   3. Command Line Interface - CLI
 
+import bisect
+import calendar
+import collections
 import ConfigParser
 import datetime
 #import dateutil.parser
-import iso8601
 import json
 import os
-import pytz
-import requests
-#import time
+import Queue
+import random
+import re
+import sys
+import threading
+import time
 #import urllib
 
+# requests, pytz and iso8601 are slow to import, so they are imported where
+# they are first used rather than here. This keeps commands that never touch
+# the network or dates (e.g. --help, or any command served by the daemon)
+# fast to start.
+
 Parser = None   # OptionParser initialized by main()
+
+# Matches the timestamps toggl itself produces, e.g. 2014-06-05T14:02:38+00:00
+ISO_8601_FAST = re.compile(
+    r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(?:(Z)|([+-])(\d\d):?(\d\d))$')
+
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SPECIAL = re.compile(r'[",\[\]{}]')
+JSON_STRING_SPECIAL = re.compile(r'["\\]')
+_json_loads = None # set by json_loads()
 VISIT_WWW_COMMAND = "open http://www.toggl.com/app/timer"
 
 #############################################################################
@@ -37,6 +57,209 @@ VISIT_WWW_COMMAND = "open http://www.toggl.com/app/timer"
 #                        |___/
 #############################################################################
 
+#----------------------------------------------------------------------------
+# JSONArrayDecoder
+#----------------------------------------------------------------------------
+class JSONArrayDecoder(object):
+    """
+    Incrementally decodes a JSON array fed to it in chunks, returning each
+    element as soon as its text is complete. Only the text of the element
+    being received is buffered, never the whole document. Elements are
+    decoded with orjson or ujson when installed, otherwise the json module.
+    """
+
+    def __init__(self, loads=None):
+        self.loads = loads or json_loads()
+        self.buffer = ''
+        self.pos = 0            # where scanning resumes in buffer
+        self.depth = 0          # 1 while directly inside the top-level array
+        self.in_string = False
+        self.element_start = None
+        self.started = False
+        self.finished = False
+        self.whole = False      # not an array; buffered for close()
+
+    def close(self):
+        """
+        Returns any elements left once all data has been fed. A document that
+        isn't an array is decoded whole: a list yields its items and null
+        yields nothing.
+        """
+        if self.started:
+            if not self.finished:
+                raise ValueError("Truncated JSON array.")
+            return []
+        if not self.buffer.strip():
+            return []
+        value = self.loads(self.buffer)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def feed(self, chunk):
+        """
+        Adds chunk to the document and returns the list of elements it
+        completed.
+        """
+        if self.finished:
+            return []
+        self.buffer += chunk
+        if self.whole:
+            return []
+        buf = self.buffer
+        pos = self.pos
+        items = []
+        while True:
+            if self.in_string:
+                m = JSON_STRING_SPECIAL.search(buf, pos)
+                if m is None:
+                    pos = len(buf)
+                    break
+                if m.group() == '\\':
+                    if m.end() >= len(buf):
+                        pos = m.start() # wait for the escaped character
+                        break
+                    pos = m.end() + 1
+                    continue
+                self.in_string = False
+                pos = m.end()
+                continue
+
+            m = JSON_SPECIAL.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            c = m.group()
+            pos = m.end()
+            if c == '"':
+                self.in_string = True
+            elif c in '[{':
+                if self.depth == 0:
+                    if c == '{':
+                        self.whole = True # decoded whole by close()
+                        break
+                    self.started = True
+                    self.element_start = pos
+                self.depth += 1
+            elif c in ']}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self._add_element(buf[self.element_start:m.start()], items)
+                    self.finished = True
+                    break
+            elif self.depth == 1: # a comma between elements
+                self._add_element(buf[self.element_start:m.start()], items)
+                self.element_start = pos
+
+        # Drop text that has been fully consumed.
+        if self.started:
+            keep = self.element_start if not self.finished else len(buf)
+            self.buffer = buf[keep:]
+            self.pos = pos - keep
+            if self.element_start is not None:
+                self.element_start -= keep
+        else:
+            self.pos = pos
+        return items
+
+    def _add_element(self, text, items):
+        text = text.strip()
+        if text:
+            items.append(self.loads(text))
+
+#----------------------------------------------------------------------------
+# LRUCache
+#----------------------------------------------------------------------------
+class LRUCache(object):
+    """
+    A thread-safe dictionary holding at most maxsize items. When full, the
+    least recently used item is discarded.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Returns the value for key, marking it most recently used, or default.
+        """
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Stores value for key, discarding the least recently used item if the
+        cache is full.
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+#----------------------------------------------------------------------------
+# NameIndex
+#----------------------------------------------------------------------------
+class NameIndex(object):
+    """
+    Indexes a list of toggl objects (dictionaries with 'id' and 'name' keys)
+    for constant-time lookups by id and logarithmic lookups by name prefix.
+    Name matches are returned in (name, id) order, so prefix resolution is
+    deterministic regardless of the order toggl returned the objects in.
+    """
+
+    def __init__(self, items, kind='Object'):
+        """
+        * items is the list of objects to index.
+        * kind(str) names the objects in error messages, e.g. 'Project'.
+        """
+        self.kind = kind
+        self.by_id = dict((item['id'], item) for item in items)
+        self.sorted_items = sorted(items, key=lambda item: (item['name'], item['id']))
+        self.names = [item['name'] for item in self.sorted_items]
+
+    def find_all_by_prefix(self, name_prefix):
+        """
+        Returns the list of objects whose name starts with name_prefix.
+        """
+        matches = []
+        i = bisect.bisect_left(self.names, name_prefix)
+        while i < len(self.names) and self.names[i].startswith(name_prefix):
+            matches.append(self.sorted_items[i])
+            i += 1
+        return matches
+
+    def find_by_id(self, id):
+        """
+        Returns the object with the given id, or None.
+        """
+        return self.by_id.get(id)
+
+    def find_by_name(self, name_prefix, strict=False):
+        """
+        Returns the object with the given name or, failing that, the first
+        object whose name starts with name_prefix. Returns None if nothing
+        matches. If strict is True and name_prefix is not an exact name but
+        matches several objects, raises a RuntimeError listing them.
+        """
+        matches = self.find_all_by_prefix(name_prefix)
+        if not matches:
+            return None
+        if matches[0]['name'] != name_prefix and len(matches) > 1 and strict:
+            raise RuntimeError("%s '%s' is ambiguous: %s" % (self.kind, name_prefix,
+                ', '.join(match['name'] for match in matches)))
+        return matches[0]
+
 #----------------------------------------------------------------------------
 # Singleton
 #----------------------------------------------------------------------------
@@ -47,16 +270,35 @@ class Singleton(type):
 
     To use, simply put the following line in your class definition:
         __metaclass__ = Singleton
+
+    Calling the class without arguments returns the shared instance. Calling
+    it with arguments always constructs a new, independent instance; this is
+    how per-account objects are created alongside the defaults.
     """
     def __init__(cls, name, bases, dict):
         super(Singleton, cls).__init__(name, bases, dict)
         cls.instance = None
+        cls.instance_lock = threading.RLock()
 
     def __call__(cls,*args,**kw):
+        if args or kw:
+            return super(Singleton, cls).__call__(*args, **kw)
+
+        # Double-checked locking: threads racing to create the instance
+        # construct it exactly once.
         if cls.instance is None:
-            cls.instance = super(Singleton, cls).__call__(*args, **kw)
+            with cls.instance_lock:
+                if cls.instance is None:
+                    cls.instance = super(Singleton, cls).__call__(*args, **kw)
         return cls.instance
 
+    def reset_instance(cls):
+        """
+        Discards the shared instance, so the next call constructs a new one.
+        """
+        with cls.instance_lock:
+            cls.instance = None
+
 #----------------------------------------------------------------------------
 # Config
 #----------------------------------------------------------------------------
@@ -103,13 +345,30 @@ class Config(object):
         """
         return self.cfg.get(section, key).strip()
 
+    def get_default(self, section, key, default=None):
+        """
+        Like get(), but returns default instead of raising if the section or
+        key is missing from the configuration file.
+        """
+        try:
+            return self.get(section, key)
+        except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+            return default
+
     def get_auth(self):
+        import requests
+        return requests.auth.HTTPBasicAuth(*self.get_credentials())
+
+    def get_credentials(self):
+        """
+        Returns the (username, password) pair to authenticate with: the API
+        token, or the account's username and password, as prefer_token
+        selects.
+        """
         if self.get('options', 'prefer_token').lower() == 'true':
-            return requests.auth.HTTPBasicAuth(self.get('auth', 'api_token'),
-                                               'api_token')
+            return (self.get('auth', 'api_token'), 'api_token')
         else:
-            return requests.auth.HTTPBasicAuth(self.get('auth', 'username'),
-                                               self.get('auth', 'password'))
+            return (self.get('auth', 'username'), self.get('auth', 'password'))
 
 #----------------------------------------------------------------------------
 # DateAndTime
@@ -122,14 +381,27 @@ class DateAndTime(object):
 
     __metaclass__ = Singleton
 
-    def __init__(self):
-        self.tz = pytz.timezone( Config().get('options', 'timezone') )
+    PARSE_CACHE_SIZE = 4096
+
+    def __init__(self, timezone=None, time_format=None):
+        """
+        timezone(str) and time_format(str) default to the timezone and
+        time_format options in ~/.togglrc.
+        """
+        import pytz
+        if timezone is None:
+            timezone = Config().get('options', 'timezone')
+        self.tz = pytz.timezone(timezone)
+        self.time_format = time_format
+        self._parsed = LRUCache(self.PARSE_CACHE_SIZE)
+        self._parsed_epochs = LRUCache(self.PARSE_CACHE_SIZE)
 
     def duration_since_epoch(self, dt):
         """
         Converts the given localized datetime object to the number of
         seconds since the epoch.
         """
+        import pytz
         return (dt.astimezone(pytz.UTC) - datetime.datetime(1970,1,1,tzinfo=pytz.UTC)).total_seconds()
 
     def duration_str_to_seconds(self, duration_str):
@@ -186,7 +458,7 @@ class DateAndTime(object):
         Formats the given datetime object according to the strftime() options
         from the configuration file.
         """
-        format = Config().get('options', 'time_format')
+        format = self.time_format or Config().get('options', 'time_format')
         return time.strftime(format)
 
     def last_minute_today(self):
@@ -209,12 +481,52 @@ class DateAndTime(object):
         """
         return self.tz.localize( dateutil.parser.parse(datetime_str) )
 
+    def parse_iso_epoch(self, iso_str):
+        """
+        Parses an ISO 8601 datetime string and returns the number of seconds
+        since the epoch. Timestamps in toggl's own format are parsed without
+        building a datetime object, and results are memoized.
+        """
+        epoch = self._parsed_epochs.get(iso_str)
+        if epoch is None:
+            epoch = self._parse_epoch(iso_str)
+            self._parsed_epochs.set(iso_str, epoch)
+        return epoch
+
     def parse_iso_str(self, iso_str):
         """
         Parses an ISO 8601 datetime string and returns a localized datetime
-        object.
+        object. Results are memoized.
+        """
+        dt = self._parsed.get(iso_str)
+        if dt is None:
+            dt = datetime.datetime.fromtimestamp(self.parse_iso_epoch(iso_str), self.tz)
+            self._parsed.set(iso_str, dt)
+        return dt
+
+    def parse_many(self, iso_strs):
         """
-        return iso8601.parse_date(iso_str).astimezone(self.tz)
+        Parses an iterable of ISO 8601 datetime strings and returns a list of
+        seconds since the epoch.
+        """
+        return [self.parse_iso_epoch(iso_str) for iso_str in iso_strs]
+
+    def _parse_epoch(self, iso_str):
+        match = ISO_8601_FAST.match(iso_str)
+        if match is None:
+            import iso8601
+            return self.duration_since_epoch(iso8601.parse_date(iso_str))
+
+        (year, month, day, hour, minute, second, fraction,
+            zulu, sign, offset_hours, offset_minutes) = match.groups()
+        epoch = calendar.timegm((int(year), int(month), int(day),
+                                 int(hour), int(minute), int(second)))
+        if fraction:
+            epoch += int(fraction.ljust(6, '0')) / 1e6
+        if not zulu:
+            offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+            epoch += -offset if sign == '+' else offset
+        return epoch
 
     def start_of_today(self):
         """
@@ -267,28 +579,599 @@ class Logger(object):
         if Logger.level >= Logger.INFO:
             print("%s%s" % (msg, end)),
 
+#----------------------------------------------------------------------------
+# Exceptions
+#----------------------------------------------------------------------------
+class TogglError(Exception):
+    """
+    Base class for errors talking to toggl.
+    """
+
+class TogglConnectionError(TogglError):
+    """
+    toggl could not be reached: connection failures and timeouts.
+    """
+
+class TogglHTTPError(TogglError):
+    """
+    toggl answered with an HTTP error status.
+    Properties:
+        status_code - the HTTP status code.
+        response - the requests.Response object.
+    """
+
+    def __init__(self, message, response):
+        super(TogglHTTPError, self).__init__(message)
+        self.response = response
+        self.status_code = response.status_code
+
+class TogglRateLimitError(TogglHTTPError):
+    """
+    toggl kept rejecting requests with 429 Too Many Requests.
+    """
+
+#----------------------------------------------------------------------------
+# Future
+#----------------------------------------------------------------------------
+class Future(object):
+    """
+    The eventual result of a call running on a WorkerPool.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn(future) once this future is done. If it is already done,
+        fn is called immediately.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def done(self):
+        """
+        Returns True if the call has finished.
+        """
+        return self._done.is_set()
+
+    def exception(self, timeout=None):
+        """
+        Waits for the call to finish and returns the exception it raised, or
+        None.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def result(self, timeout=None):
+        """
+        Waits for the call to finish and returns its result. If the call
+        raised an exception, it is re-raised here with its original traceback.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def set_exception(self, exc_info):
+        """
+        Completes this future with the given sys.exc_info() triple.
+        """
+        self._exc_info = exc_info
+        self._finish()
+
+    def set_result(self, result):
+        """
+        Completes this future with the given result.
+        """
+        self._result = result
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    def _wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise RuntimeError("Timed out waiting for result.")
+
+#----------------------------------------------------------------------------
+# WorkerPool
+#----------------------------------------------------------------------------
+class WorkerPool(object):
+    """
+    A fixed-size pool of worker threads. At most `size` calls run at once,
+    and submit() blocks once `size` further calls are queued, so producers
+    streaming work into the pool never get far ahead of the workers.
+    """
+
+    def __init__(self, size=8):
+        if size < 1:
+            raise ValueError("WorkerPool size must be at least 1.")
+        self.size = size
+        self._queue = Queue.Queue(maxsize=size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def map(self, fn, iterable):
+        """
+        Calls fn on every item of iterable and returns a list of results, in
+        order. The first exception raised by a call is re-raised.
+        """
+        return [future.result() for future in [self.submit(fn, item) for item in iterable]]
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting new work. If wait is True, blocks until all queued
+        calls have finished.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def submit(self, fn, *args, **kw):
+        """
+        Schedules fn(*args, **kw) and returns a Future for its result.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit to a WorkerPool after shutdown.")
+        self._start_workers()
+        future = Future()
+        self._queue.put((future, fn, args, kw))
+        return future
+
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.size:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kw = item
+            try:
+                future.set_result(fn(*args, **kw))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+#----------------------------------------------------------------------------
+# RateLimiter
+#----------------------------------------------------------------------------
+class RateLimiter(object):
+    """
+    A thread-safe token bucket. Up to `burst` requests may be made at once,
+    after which acquire() paces callers to `rate` requests per second.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rate, burst=1):
+        """
+        * rate(float) is the sustained number of requests per second. A
+          rate of 0 or less disables limiting.
+        * burst(int) is the bucket size.
+        """
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key, rate, burst=1):
+        """
+        Returns the RateLimiter registered under key, creating it with the
+        given rate and burst if needed (an existing limiter keeps its own
+        settings). toggl limits requests per API token, so every Transport
+        using the same credentials shares one bucket.
+        """
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(rate, burst)
+            return cls._shared[key]
+
+    def acquire(self):
+        """
+        Blocks until a request may be made.
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+#----------------------------------------------------------------------------
+# SingleFlight
+#----------------------------------------------------------------------------
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical calls. While a call for a key is in
+    progress, other threads asking for the same key wait for it and share
+    its result (or exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kw):
+        """
+        Returns fn(*args, **kw), or the result of the identical call already
+        in progress for key.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if leader:
+            try:
+                future.set_result(fn(*args, **kw))
+            except Exception:
+                future.set_exception(sys.exc_info())
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return future.result()
+
+#----------------------------------------------------------------------------
+# RequestEvent
+#----------------------------------------------------------------------------
+class RequestEvent(object):
+    """
+    One logical request made by a Transport, passed to the request hooks.
+    Retries of the request are counted rather than reported separately.
+    Properties:
+        method - the HTTP method, e.g. 'get'.
+        url - the requested URL.
+        started_at - when the request was started, in seconds since the
+          epoch.
+        elapsed - seconds the request took, or None while it is in progress.
+          Streamed responses are timed until the body has been read.
+        retries - number of times the request was retried.
+        status_code - the final HTTP status code, or None if no response
+          was received.
+        bytes_sent - size of the request body.
+        bytes_received - size of the response body.
+        error - the TogglError the request failed with, or None.
+    """
+
+    def __init__(self, method, url, data=None):
+        self.method = method
+        self.url = url
+        self.started_at = time.time()
+        self.elapsed = None
+        self.retries = 0
+        self.status_code = None
+        self.bytes_sent = len(data) if data else 0
+        self.bytes_received = 0
+        self.error = None
+
+#----------------------------------------------------------------------------
+# Transport
+#----------------------------------------------------------------------------
+class Transport(object):
+    """
+    A pooled, keep-alive HTTP session. Connections to toggl are reused across
+    requests instead of paying a new TCP+TLS handshake for every call, and the
+    authentication object is built once.
+
+    Concurrent identical GET requests are coalesced into one by a
+    SingleFlight. Requests are paced by a RateLimiter shared by all transports using the
+    same credentials. 429 responses are retried for every method, while 5xx
+    responses, connection errors and timeouts are retried only for the
+    idempotent methods (get, put and delete). Retries use jittered
+    exponential backoff, and a 429 Retry-After header is honoured up to
+    BACKOFF_MAX.
+
+    Any parameter left as None is read from the [options] section of
+    ~/.togglrc (pool_size, connect_timeout, read_timeout, rate_limit,
+    rate_burst, max_retries), falling back to the class defaults.
+
+    Hooks added with add_hook() are called before and after every request
+    made by any transport; see pytoggl.metrics for a hook that collects
+    per-endpoint statistics.
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_CONNECT_TIMEOUT = 10.0
+    DEFAULT_READ_TIMEOUT = 30.0
+    DEFAULT_RATE_LIMIT = 1.0 # toggl's documented limit, in requests/second
+    DEFAULT_RATE_BURST = 5
+    DEFAULT_MAX_RETRIES = 4
+    BACKOFF_BASE = 0.5 # seconds
+    BACKOFF_MAX = 30.0 # seconds
+
+    IDEMPOTENT_METHODS = ('delete', 'get', 'put')
+
+    hooks = [] # (before, after) pairs shared by every transport
+    hooks_lock = threading.Lock()
+
+    def __init__(self, auth=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 rate_limit=None, rate_burst=None, max_retries=None):
+        """
+        * auth is an optional requests auth object. Defaults to
+          Config().get_auth().
+        * pool_size(int) is the maximum number of connections kept alive.
+        * connect_timeout(float) and read_timeout(float) are in seconds.
+        * rate_limit(float) is the number of requests per second allowed for
+          these credentials; 0 disables limiting. rate_burst(int) is how many
+          requests may be made at once before limiting starts.
+        * max_retries(int) is how often a failed request is retried.
+        """
+        if pool_size is None:
+            pool_size = int(self._option('pool_size', self.DEFAULT_POOL_SIZE))
+        if connect_timeout is None:
+            connect_timeout = float(self._option('connect_timeout', self.DEFAULT_CONNECT_TIMEOUT))
+        if read_timeout is None:
+            read_timeout = float(self._option('read_timeout', self.DEFAULT_READ_TIMEOUT))
+        if rate_limit is None:
+            rate_limit = float(self._option('rate_limit', self.DEFAULT_RATE_LIMIT))
+        if rate_burst is None:
+            rate_burst = int(self._option('rate_burst', self.DEFAULT_RATE_BURST))
+        if max_retries is None:
+            max_retries = int(self._option('max_retries', self.DEFAULT_MAX_RETRIES))
+
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.auth = auth if auth is not None else Config().get_auth()
+
+        self.rate_limiter = RateLimiter.shared(
+            getattr(self.session.auth, 'username', None), rate_limit, rate_burst)
+        self.single_flight = SingleFlight()
+
+    @classmethod
+    def add_hook(cls, before=None, after=None):
+        """
+        Registers request hooks. before(event) is called when a request is
+        started and after(event) once it has finished, successfully or not,
+        with a RequestEvent. Either may be None. Hooks may be called from
+        several threads at once. Returns a handle for remove_hook().
+        """
+        hook = (before, after)
+        with cls.hooks_lock:
+            # Replaced rather than appended to, so requests in progress can
+            # iterate over the list without locking.
+            cls.hooks = cls.hooks + [hook]
+        return hook
+
+    @classmethod
+    def remove_hook(cls, hook):
+        """
+        Unregisters hooks added by add_hook().
+        """
+        with cls.hooks_lock:
+            cls.hooks = [h for h in cls.hooks if h is not hook]
+
+    def _option(self, key, default):
+        """
+        Returns the given [options] value from the configuration file, or
+        default if it isn't set.
+        """
+        return Config().get_default('options', key, default)
+
+    def backoff(self, attempt, response=None):
+        """
+        Returns the number of seconds to wait before retry number attempt
+        (starting at 0). Uses the response's Retry-After header if present,
+        otherwise exponential backoff with full jitter. Never more than
+        BACKOFF_MAX.
+        """
+        if response is not None:
+            try:
+                return max(0.0, min(self.BACKOFF_MAX, float(response.headers['Retry-After'])))
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        self.session.close()
+
+    def iter_json(self, url):
+        """
+        GETs url, which must return a JSON array, and yields its elements as
+        they are received. The response body is streamed and never held in
+        memory as a whole.
+        """
+        event = self._start_event(url, 'get')
+        r = self._request(url, 'get', None, None, True, event)
+        try:
+            decoder = JSONArrayDecoder()
+            for chunk in r.iter_content(JSON_CHUNK_SIZE):
+                if event is not None:
+                    event.bytes_received += len(chunk)
+                for item in decoder.feed(chunk):
+                    yield item
+            for item in decoder.close():
+                yield item
+        finally:
+            r.close()
+            self._finish_event(event)
+
+    def request(self, url, method, data=None, headers=None, stream=False):
+        """
+        Makes an HTTP request on the pooled session and returns the
+        requests.Response object, retrying as described above. Raises a
+        TogglError subclass if the request ultimately fails. If stream is
+        True the body is not read up front (and GETs are not coalesced).
+        """
+        if method not in ('delete', 'get', 'post', 'put'):
+            raise NotImplementedError('HTTP method "%s" not implemented.' % method)
+        if method == 'get' and not stream:
+            key = (url, data, tuple(sorted((headers or {}).items())))
+            return self.single_flight.do(key, self._send, url, method, data, headers)
+        return self._send(url, method, data, headers, stream)
+
+    def _finish_event(self, event):
+        if event is None:
+            return
+        event.elapsed = time.time() - event.started_at
+        for _, after in self.hooks:
+            if after is not None:
+                after(event)
+
+    def _send(self, url, method, data, headers, stream=False):
+        event = self._start_event(url, method, data)
+        r = self._request(url, method, data, headers, stream, event)
+        if event is not None:
+            if stream:
+                event.bytes_received = int(r.headers.get('Content-Length') or 0)
+            else:
+                event.bytes_received = len(r.content)
+            self._finish_event(event)
+        return r
+
+    def _start_event(self, url, method, data=None):
+        """
+        Returns a RequestEvent for a new request after passing it to the
+        before hooks, or None if no hooks are registered.
+        """
+        if not self.hooks:
+            return None
+        event = RequestEvent(method, url, data)
+        for before, _ in self.hooks:
+            if before is not None:
+                before(event)
+        return event
+
+    def _request(self, url, method, data, headers, stream=False, event=None):
+        import requests
+        attempt = 0
+        while True:
+            if event is not None:
+                event.retries = attempt
+            self.rate_limiter.acquire()
+            try:
+                r = self.session.request(method.upper(), url, data=data, headers=headers,
+                                         timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout), e:
+                if attempt < self.max_retries and method in self.IDEMPOTENT_METHODS:
+                    Logger.debug('Retrying %s %s after error: %s' % (method, url, e))
+                    time.sleep(self.backoff(attempt))
+                    attempt += 1
+                    continue
+                error = TogglConnectionError('%s %s failed: %s' % (method.upper(), url, e))
+                if event is not None:
+                    event.error = error
+                    self._finish_event(event)
+                raise error
+
+            retryable = r.status_code == 429 or \
+                (r.status_code >= 500 and method in self.IDEMPOTENT_METHODS)
+            if retryable and attempt < self.max_retries:
+                Logger.debug('Retrying %s %s after HTTP %d' % (method, url, r.status_code))
+                r.close() # return a streamed response's connection to the pool
+                time.sleep(self.backoff(attempt, r if r.status_code == 429 else None))
+                attempt += 1
+                continue
+
+            if r.status_code >= 400:
+                message = '%s %s failed with HTTP %d: %s' % \
+                    (method.upper(), url, r.status_code, r.text)
+                if r.status_code == 429:
+                    error = TogglRateLimitError(message, r)
+                else:
+                    error = TogglHTTPError(message, r)
+                if event is not None:
+                    event.status_code = r.status_code
+                    event.bytes_received = len(r.content)
+                    event.error = error
+                    self._finish_event(event)
+                raise error
+            if event is not None:
+                event.status_code = r.status_code
+            return r
+
+#----------------------------------------------------------------------------
+# DefaultTransport
+#----------------------------------------------------------------------------
+class DefaultTransport(Transport):
+    """
+    Singleton Transport configured from ~/.togglrc. This is the session
+    httpexec() uses.
+    """
+
+    __metaclass__ = Singleton
+
 #----------------------------------------------------------------------------
 # httpexec
 #----------------------------------------------------------------------------
 def httpexec(url, method, data=None, headers={'content-type' : 'application/json'}):
     """
-    Makes an HTTP request. Returns the raw text data received.
+    Makes an HTTP request through the shared DefaultTransport. Returns the
+    raw text data received. Raises a TogglError subclass on failure.
     """
     try:
-        if method == 'delete':
-            r = requests.delete(url, auth=Config().get_auth(), data=data, headers=headers)
-        elif method == 'get':
-            r = requests.get(url, auth=Config().get_auth(), data=data, headers=headers)
-        elif method == 'post':
-            r = requests.post(url, auth=Config().get_auth(), data=data, headers=headers)
-        elif method == 'put':
-            r = requests.post(url, auth=Config().get_auth(), data=data, headers=headers)
-        else:
-            raise NotImplementedError('HTTP method "%s" not implemented.' % method)
-        r.raise_for_status() # raise exception on error
-        return r.text
-    except Exception, e:
-        print 'Sent: %s' % data
-        print e
-        print r.text
-        #sys.exit(1)
+        return DefaultTransport().request(url, method, data=data, headers=headers).text
+    except TogglError:
+        Logger.debug('Sent: %s' % data)
+        raise
+
+#----------------------------------------------------------------------------
+# json_loads
+#----------------------------------------------------------------------------
+def json_loads():
+    """
+    Returns the fastest available JSON decoding function: orjson's or
+    ujson's loads() if either is installed, otherwise json.loads.
+    """
+    global _json_loads
+    if _json_loads is None:
+        try:
+            import orjson as fast_json
+        except ImportError:
+            try:
+                import ujson as fast_json
+            except ImportError:
+                fast_json = json
+        _json_loads = fast_json.loads
+    return _json_loads
@@ -27,4 +27,8 @@ setup(
         'pytz>=2014.10',
         'requests>=2.5',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'pandas': ['pandas'],
+    },
 )
@@ -0,0 +1,91 @@
+"""
+Tests that DateAndTime's fast ISO 8601 parsing agrees with iso8601, which
+it stands in for.
+
+Run with: python -m unittest discover tests
+"""
+
+import unittest
+
+import iso8601
+
+from pytoggl.utility import ISO_8601_FAST, DateAndTime
+
+FAST_PATH = [
+    # toggl's own format
+    '2014-06-05T14:02:38+00:00',
+    '1970-01-01T00:00:00+00:00',
+    '2038-01-19T03:14:08+00:00',
+    # Z and offsets, with and without a colon
+    '2014-06-05T14:02:38Z',
+    '2014-06-05T14:02:38-05:00',
+    '2014-06-05T14:02:38+05:30',
+    '2014-06-05T14:02:38+0530',
+    '2014-06-05T14:02:38-0930',
+    '2014-12-31T23:30:00-01:00', # a different year in UTC
+    '2016-02-29T12:00:00+14:00',
+    # fractional seconds
+    '2014-06-05T14:02:38.5Z',
+    '2014-06-05T14:02:38.123+02:00',
+    '2014-06-05T14:02:38.000001-07:00',
+    '2014-06-05T14:02:38.999999Z',
+    # around the DST changes in America/New_York and Europe/Berlin
+    '2014-03-09T06:59:59+00:00',
+    '2014-03-09T07:00:00+00:00',
+    '2014-03-09T01:59:59-05:00',
+    '2014-03-09T03:00:00-04:00',
+    '2014-11-02T01:30:00-04:00',
+    '2014-11-02T01:30:00-05:00',
+    '2014-03-30T01:59:59+01:00',
+    '2014-03-30T03:00:00+02:00',
+    '2014-10-26T02:30:00+02:00',
+    '2014-10-26T02:30:00+01:00',
+]
+
+SLOW_PATH = [
+    '2014-06-05T14:02+00:00',
+    '2014-06-05 14:02:38+00:00',
+    '2014-06-05',
+    '20140605T140238Z',
+]
+
+TIMEZONES = ['UTC', 'America/New_York', 'Europe/Berlin', 'Asia/Kolkata']
+
+class ISOParsingTest(unittest.TestCase):
+
+    def expected_epoch(self, dt, iso_str):
+        return dt.duration_since_epoch(iso8601.parse_date(iso_str))
+
+    def test_fast_path_used(self):
+        for iso_str in FAST_PATH:
+            self.assertTrue(ISO_8601_FAST.match(iso_str), iso_str)
+        for iso_str in SLOW_PATH:
+            self.assertFalse(ISO_8601_FAST.match(iso_str), iso_str)
+
+    def test_epoch_matches_iso8601(self):
+        dt = DateAndTime(timezone='UTC')
+        for iso_str in FAST_PATH + SLOW_PATH:
+            self.assertAlmostEqual(dt.parse_iso_epoch(iso_str),
+                                   self.expected_epoch(dt, iso_str), places=6, msg=iso_str)
+
+    def test_epoch_independent_of_timezone(self):
+        epochs = [DateAndTime(timezone=tz).parse_many(FAST_PATH) for tz in TIMEZONES]
+        for other in epochs[1:]:
+            self.assertEqual(other, epochs[0])
+
+    def test_localized_datetime_matches_iso8601(self):
+        for tz in TIMEZONES:
+            dt = DateAndTime(timezone=tz)
+            for iso_str in FAST_PATH:
+                parsed = dt.parse_iso_str(iso_str)
+                expected = iso8601.parse_date(iso_str).astimezone(dt.tz)
+                self.assertEqual(parsed, expected, '%s in %s' % (iso_str, tz))
+                self.assertEqual(parsed.utcoffset(), expected.utcoffset(), '%s in %s' % (iso_str, tz))
+
+    def test_memoized(self):
+        dt = DateAndTime(timezone='Europe/Berlin')
+        self.assertTrue(dt.parse_iso_str(FAST_PATH[0]) is dt.parse_iso_str(FAST_PATH[0]))
+        self.assertEqual(dt.parse_iso_epoch(FAST_PATH[0]), dt.parse_iso_epoch(FAST_PATH[0]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+Tests for pytoggl.journal.Journal, against an in-memory stand-in for toggl.
+
+Run with: python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pytoggl.journal import ID_PLACEHOLDER, Journal
+from pytoggl.state import RunningEntryState
+from pytoggl.utility import DateAndTime, TogglConnectionError, TogglError, TogglHTTPError
+
+class FakeResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakeClient(object):
+    """
+    Implements the part of the client interface the journal uses. Entries
+    are kept in memory; set online to False to make every request fail.
+    """
+
+    url = 'https://toggl.test/api/v8'
+
+    def __init__(self, directory):
+        self.online = True
+        self.entries = {}
+        self.requests = []
+        self.next_id = 100
+        self.state = RunningEntryState(os.path.join(directory, 'state.json'))
+        self.dt = DateAndTime(timezone='UTC', time_format='%H:%M')
+
+    def date_and_time(self):
+        return self.dt
+
+    def httpexec(self, url, method, data=None):
+        path = url[len(self.url):]
+        self.requests.append((method, path))
+        if not self.online:
+            raise TogglConnectionError('%s %s failed' % (method, url))
+        body = json.loads(data)['time_entry'] if data else None
+        if method == 'post':
+            body['id'] = self.next_id
+            self.next_id += 1
+            self.entries[body['id']] = body
+            return json.dumps({'data': body})
+
+        entry_id = int(path.rsplit('/', 1)[1])
+        if entry_id not in self.entries:
+            raise TogglHTTPError('not found', FakeResponse(404))
+        if method == 'delete':
+            del self.entries[entry_id]
+            return '[]'
+        self.entries[entry_id].update(body)
+        return json.dumps({'data': self.entries[entry_id]})
+
+    def iter_json(self, url):
+        self.requests.append(('get', url[len(self.url):].split('?')[0]))
+        if not self.online:
+            raise TogglConnectionError('GET %s failed' % url)
+        return iter(self.entries.values())
+
+    def running_state(self):
+        return self.state
+
+def entry_json(guid, **fields):
+    entry = {'guid': guid, 'description': 'work', 'start': '2014-06-05T14:00:00+00:00'}
+    entry.update(fields)
+    return json.dumps({'time_entry': entry})
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeClient(self.directory)
+        self.journal = Journal(self.client, os.path.join(self.directory, 'journal.jsonl'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_send_online(self):
+        response = self.journal.send('post', '/time_entries', entry_json('g1', duration=60), 'g1')
+        self.assertEqual(response['data']['id'], 100)
+        self.assertFalse(self.journal.pending())
+
+    def test_offline_changes_are_queued_and_replayed_in_order(self):
+        self.client.online = False
+        self.assertEqual(self.journal.send('post', '/time_entries', entry_json('g1', duration=-1), 'g1'), None)
+        self.journal.send('put', '/time_entries/%s' % ID_PLACEHOLDER,
+                          entry_json('g1', duration=60), ref='g1')
+        self.assertTrue(self.journal.pending())
+
+        self.client.online = True
+        result = self.journal.flush()
+        self.assertEqual((result.replayed, len(result.failed), result.remaining), (2, 0, 0))
+        self.assertEqual(self.client.entries[100]['duration'], 60)
+        self.assertEqual(self.journal.id_for('g1'), 100)
+
+    def test_replayed_create_is_not_duplicated(self):
+        self.journal.send('post', '/time_entries', entry_json('g1', duration=60), 'g1')
+        self.journal.append('post', '/time_entries', entry_json('g1', duration=60), 'g1')
+        self.journal.flush()
+        self.assertEqual(len(self.client.entries), 1)
+
+    def test_rejected_change_is_dropped(self):
+        self.journal.append('delete', '/time_entries/5')
+        self.journal.append('put', '/time_entries/5', entry_json('g5'))
+        result = self.journal.flush()
+        self.assertEqual((result.replayed, len(result.failed), result.remaining), (1, 1, 0))
+
+    def test_change_to_entry_never_created_is_dropped(self):
+        self.journal.append('put', '/time_entries/%s' % ID_PLACEHOLDER, entry_json('nope'), ref='nope')
+        result = self.journal.flush()
+        self.assertEqual((result.replayed, len(result.failed)), (0, 1))
+
+    def test_ref_resolved_without_queueing(self):
+        self.client.online = False
+        self.journal.send('post', '/time_entries', entry_json('g1', duration=-1), 'g1')
+        self.client.online = True
+        self.journal.flush()
+
+        # A new journal (e.g. a later command) must find the id on toggl.
+        journal = Journal(self.client, self.journal.path)
+        journal.send('put', '/time_entries/%s' % ID_PLACEHOLDER,
+                     json.dumps({'time_entry': {'stop': '2014-06-05T15:00:00+00:00', 'duration': 3600}}),
+                     ref='g1')
+        self.assertFalse(journal.pending())
+        self.assertEqual(self.client.entries[100]['duration'], 3600)
+
+        self.assertRaises(TogglError, journal.send, 'put', '/time_entries/%s' % ID_PLACEHOLDER,
+                          entry_json('nope'), ref='nope')
+
+    def test_flush_records_id_in_running_state(self):
+        self.client.online = False
+        self.journal.send('post', '/time_entries', entry_json('g1', duration=-1), 'g1')
+        self.client.state.set({'guid': 'g1', 'description': 'work'})
+        self.client.online = True
+        self.journal.flush()
+        self.assertEqual(self.client.state.get()['entry']['id'], 100)
+
+    def test_offline_sends_skip_flush(self):
+        self.client.online = False
+        self.journal.send('post', '/time_entries', entry_json('g1', duration=60), 'g1')
+        requests = len(self.client.requests)
+        self.journal.send('post', '/time_entries', entry_json('g2', duration=60), 'g2')
+        self.assertEqual(len(self.client.requests), requests)
+        self.assertEqual(self.journal.flush().remaining, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests for pytoggl.utility.JSONArrayDecoder.
+
+Run with: python -m unittest discover tests
+"""
+
+import json
+import random
+import unittest
+
+from pytoggl.utility import JSONArrayDecoder
+
+DOCUMENTS = [
+    [],
+    [1, 2, 3],
+    [{"id": 1, "description": "plain"}, {"id": 2, "tags": ["a", "b"]}],
+    [{"description": "quote \" and backslash \\ and comma , and ] } [ {"}],
+    [{"description": u"unicode \u00e9\u2603 and \\u escape"}, "\\", "\\\""],
+    [[1, [2, [3]]], {"nested": {"deeper": [{"x": None}]}}],
+    [None, True, False, 0, -1.5e3, ""],
+]
+
+def decode(text, chunk_sizes):
+    """
+    Feeds text to a new decoder in chunks of the given sizes (the last one
+    repeating) and returns all elements it produced.
+    """
+    decoder = JSONArrayDecoder(loads=json.loads)
+    items = []
+    pos = 0
+    i = 0
+    while pos < len(text):
+        size = chunk_sizes[min(i, len(chunk_sizes) - 1)]
+        items.extend(decoder.feed(text[pos:pos + size]))
+        pos += size
+        i += 1
+    items.extend(decoder.close())
+    return items
+
+class JSONArrayDecoderTest(unittest.TestCase):
+
+    def test_whole_document(self):
+        for doc in DOCUMENTS:
+            self.assertEqual(decode(json.dumps(doc), [1000000]), doc)
+
+    def test_single_characters(self):
+        for doc in DOCUMENTS:
+            self.assertEqual(decode(json.dumps(doc), [1]), doc)
+
+    def test_random_splits(self):
+        rand = random.Random(0)
+        for doc in DOCUMENTS:
+            text = json.dumps(doc, indent=rand.choice([None, 2]))
+            for _ in range(200):
+                sizes = [rand.randint(1, 8) for _ in range(len(text))]
+                self.assertEqual(decode(text, sizes), doc)
+
+    def test_split_escape(self):
+        text = '["a\\\\", "b\\"c"]'
+        for split in range(1, len(text)):
+            self.assertEqual(decode(text, [split, len(text)]), ["a\\", 'b"c'])
+
+    def test_elements_returned_as_completed(self):
+        decoder = JSONArrayDecoder(loads=json.loads)
+        self.assertEqual(decoder.feed('[{"id": 1}, {"id"'), [{"id": 1}])
+        self.assertEqual(decoder.feed(': 2}]'), [{"id": 2}])
+        self.assertEqual(decoder.close(), [])
+
+    def test_null(self):
+        self.assertEqual(decode('null', [1]), [])
+        self.assertEqual(decode('', [1]), [])
+
+    def test_object_decoded_whole(self):
+        text = '{"data": [1, 2], "since": 3}'
+        for split in range(1, len(text)):
+            self.assertEqual(decode(text, [split, len(text)]), [{"data": [1, 2], "since": 3}])
+
+    def test_truncated_array(self):
+        decoder = JSONArrayDecoder(loads=json.loads)
+        decoder.feed('[1, 2')
+        self.assertRaises(ValueError, decoder.close)
+
+    def test_data_after_array_ignored(self):
+        decoder = JSONArrayDecoder(loads=json.loads)
+        self.assertEqual(decoder.feed('[1]'), [1])
+        self.assertEqual(decoder.feed('\n'), [])
+        self.assertEqual(decoder.close(), [])
+
+if __name__ == '__main__':
+    unittest.main()
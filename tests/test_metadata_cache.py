@@ -0,0 +1,142 @@
+"""
+Tests for the revalidation of pytoggl.cache.MetadataCache entries by
+cached_get() and cached_get_json(), against a stand-in for the transport.
+
+Run with: python -m unittest discover tests
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from pytoggl.cache import MetadataCache, cached_get, cached_get_json, write_json_atomic
+
+URL = 'https://toggl.test/api/v8/clients'
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+class FakeTransport(object):
+    """
+    Serves body for every GET, with the given ETag and Last-Modified
+    headers. Answers 304 when the request's validators match them.
+    """
+
+    def __init__(self, body, etag=None, last_modified=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.requests = [] # request headers, one dictionary per request
+
+    def request(self, url, method, headers=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        if (self.etag and headers.get('If-None-Match') == self.etag) or \
+                (self.last_modified and headers.get('If-Modified-Since') == self.last_modified):
+            return FakeResponse(304, '', {})
+        response_headers = {}
+        if self.etag:
+            response_headers['ETag'] = self.etag
+        if self.last_modified:
+            response_headers['Last-Modified'] = self.last_modified
+        return FakeResponse(200, self.body, response_headers)
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = MetadataCache(path=self.directory, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expire(self):
+        record = self.cache.get_record(URL)
+        record['stored_at'] -= 61
+        write_json_atomic(self.cache._file(URL), record)
+
+    def get(self, transport, **kwargs):
+        return cached_get(URL, cache=self.cache, transport=transport, **kwargs)
+
+    def test_fresh_body_served_without_request(self):
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(transport.requests, [{}])
+        self.assertEqual(self.cache.get(URL), '[1]')
+
+    def test_ttl_expiry_revalidates(self):
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.get(transport)
+        self.expire()
+        self.assertEqual(self.cache.get(URL), None)
+        self.get(transport)
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(transport.requests[1], {'If-None-Match': '"v1"'})
+
+    def test_not_modified_reuses_cached_body(self):
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.get(transport)
+        self.expire()
+        transport.body = 'not sent with a 304'
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(self.cache.get(URL), '[1]') # fresh again
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(len(transport.requests), 2)
+
+    def test_changed_etag_replaces_body(self):
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.get(transport)
+        self.expire()
+        transport.body, transport.etag = '[1, 2]', '"v2"'
+        self.assertEqual(self.get(transport), '[1, 2]')
+        record = self.cache.get_record(URL)
+        self.assertEqual((record['body'], record['etag']), ('[1, 2]', '"v2"'))
+
+        self.expire()
+        self.get(transport)
+        self.assertEqual(transport.requests[-1], {'If-None-Match': '"v2"'})
+
+    def test_last_modified(self):
+        transport = FakeTransport('[1]', last_modified='Thu, 05 Jun 2014 14:00:00 GMT')
+        self.get(transport)
+        self.expire()
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(transport.requests[1],
+                         {'If-Modified-Since': 'Thu, 05 Jun 2014 14:00:00 GMT'})
+
+    def test_unchanged_hash_without_validators(self):
+        transport = FakeTransport('[{"id": 1}]')
+        first = cached_get_json(URL, cache=self.cache, transport=transport)
+        stored_at = self.cache.get_record(URL)['stored_at']
+        self.expire()
+        second = cached_get_json(URL, cache=self.cache, transport=transport)
+        self.assertTrue(second is first) # decoded value reused
+        self.assertEqual(transport.requests, [{}, {}])
+        self.assertTrue(self.cache.get_record(URL)['stored_at'] >= stored_at)
+
+        self.expire()
+        transport.body = '[{"id": 2}]'
+        self.assertEqual(cached_get_json(URL, cache=self.cache, transport=transport), [{'id': 2}])
+
+    def test_refresh_revalidates_fresh_body(self):
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.get(transport)
+        transport.body, transport.etag = '[2]', '"v2"'
+        self.assertEqual(self.get(transport), '[1]')
+        self.assertEqual(self.get(transport, refresh=True), '[2]')
+        self.assertEqual(transport.requests[1], {'If-None-Match': '"v1"'})
+
+    def test_zero_ttl_disables_cache(self):
+        self.cache = MetadataCache(path=self.directory, ttl=0)
+        transport = FakeTransport('[1]', etag='"v1"')
+        self.get(transport)
+        self.get(transport)
+        self.assertEqual(transport.requests, [{}, {}])
+
+if __name__ == '__main__':
+    unittest.main()
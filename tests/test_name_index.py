@@ -0,0 +1,81 @@
+"""
+Tests for pytoggl.utility.NameIndex.
+
+Run with: python -m unittest discover tests
+"""
+
+import unittest
+
+from pytoggl.utility import NameIndex
+
+ITEMS = [
+    {'id': 5, 'name': 'Website redesign'},
+    {'id': 2, 'name': 'Web'},
+    {'id': 9, 'name': 'Webinar'},
+    {'id': 3, 'name': 'Admin'},
+    {'id': 7, 'name': 'Website'},
+    {'id': 1, 'name': 'Admin'},
+]
+
+def ids(items):
+    return [item['id'] for item in items]
+
+class NameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NameIndex(ITEMS, kind='Project')
+
+    def test_find_by_id(self):
+        self.assertEqual(self.index.find_by_id(9)['name'], 'Webinar')
+        self.assertEqual(self.index.find_by_id(4), None)
+
+    def test_prefix_matches_in_name_order(self):
+        self.assertEqual(ids(self.index.find_all_by_prefix('Web')), [2, 9, 7, 5])
+        self.assertEqual(ids(self.index.find_all_by_prefix('Websi')), [7, 5])
+        self.assertEqual(ids(self.index.find_all_by_prefix('Website ')), [5])
+        self.assertEqual(self.index.find_all_by_prefix('web'), [])
+        self.assertEqual(self.index.find_all_by_prefix('Zeta'), [])
+        self.assertEqual(len(self.index.find_all_by_prefix('')), len(ITEMS))
+
+    def test_prefix_lookup(self):
+        self.assertEqual(self.index.find_by_name('Webi')['id'], 9)
+        self.assertEqual(self.index.find_by_name('Websi')['id'], 7)
+        self.assertEqual(self.index.find_by_name('Nothing'), None)
+
+    def test_exact_match_wins(self):
+        self.assertEqual(self.index.find_by_name('Web')['id'], 2)
+        self.assertEqual(self.index.find_by_name('Website')['id'], 7)
+        self.assertEqual(self.index.find_by_name('Web', strict=True)['id'], 2)
+        self.assertEqual(self.index.find_by_name('Website', strict=True)['id'], 7)
+
+    def test_duplicate_names_resolve_to_lowest_id(self):
+        self.assertEqual(self.index.find_by_name('Admin')['id'], 1)
+        self.assertEqual(self.index.find_by_name('Admin', strict=True)['id'], 1)
+        self.assertEqual(self.index.find_by_name('Adm')['id'], 1)
+
+    def test_independent_of_input_order(self):
+        index = NameIndex(list(reversed(ITEMS)))
+        self.assertEqual(ids(index.find_all_by_prefix('Web')), [2, 9, 7, 5])
+        self.assertEqual(index.find_by_name('Admin')['id'], 1)
+
+    def test_strict_ambiguous_prefix(self):
+        self.assertEqual(self.index.find_by_name('Webs')['id'], 7)
+        try:
+            self.index.find_by_name('Webs', strict=True)
+        except RuntimeError, e:
+            self.assertEqual(str(e), "Project 'Webs' is ambiguous: Website, Website redesign")
+        else:
+            self.fail("ambiguous prefix accepted")
+
+    def test_strict_unique_prefix(self):
+        self.assertEqual(self.index.find_by_name('Webi', strict=True)['id'], 9)
+        self.assertEqual(self.index.find_by_name('Website r', strict=True)['id'], 5)
+        self.assertEqual(self.index.find_by_name('Nothing', strict=True), None)
+
+    def test_empty(self):
+        index = NameIndex([])
+        self.assertEqual(index.find_by_name('Web', strict=True), None)
+        self.assertEqual(index.find_all_by_prefix(''), [])
+
+if __name__ == '__main__':
+    unittest.main()
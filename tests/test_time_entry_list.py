@@ -0,0 +1,139 @@
+"""
+Tests for the indexes of pytoggl.toggl.TimeEntryList, against an in-memory
+stand-in for toggl.
+
+Run with: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pytoggl.state import RunningEntryState
+from pytoggl.toggl import TimeEntry, TimeEntryList
+from pytoggl.utility import DateAndTime
+
+class FakeJournal(object):
+
+    def pending(self):
+        return False
+
+class FakeClient(object):
+    """
+    Implements the part of the client interface TimeEntryList uses. The
+    time entries returned by every request are in entries.
+    """
+
+    url = 'https://toggl.test/api/v8'
+
+    def __init__(self, directory):
+        self.entries = []
+        self.state = RunningEntryState(os.path.join(directory, 'state.json'))
+        self.dt = DateAndTime(timezone='UTC', time_format='%H:%M')
+
+    def date_and_time(self):
+        return self.dt
+
+    def iter_json(self, url):
+        return iter([dict(entry) for entry in self.entries])
+
+    def journal(self):
+        return FakeJournal()
+
+    def running_state(self):
+        return self.state
+
+def entry_data(entry_id, description, start, duration=60, pid=None):
+    data = {'id': entry_id, 'description': description, 'duration': duration,
+            'start': '2014-06-05T%s:00+00:00' % start}
+    if pid is not None:
+        data['pid'] = pid
+    return data
+
+class TimeEntryListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeClient(self.directory)
+        self.client.entries = [
+            entry_data(1, 'write', '09:00', pid=10),
+            entry_data(2, 'review', '10:00', pid=10),
+            entry_data(3, 'write', '11:00'),
+            entry_data(4, 'write', '12:00', duration=-1402056000, pid=20),
+        ]
+        self.entries = TimeEntryList(client=self.client)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ids(self, entries):
+        return [entry.get('id') for entry in entries]
+
+    def new_entry(self, **data):
+        return TimeEntry(data_dict=data, client=self.client)
+
+    def test_indexes_after_reload(self):
+        self.assertEqual(self.entries.find_by_id(2).get('description'), 'review')
+        self.assertEqual(self.entries.find_by_id(5), None)
+        self.assertEqual(self.entries.find_by_description('write').get('id'), 4)
+        self.assertEqual(self.ids(self.entries.find_all_by_description('write')), [4, 3, 1])
+        self.assertEqual(self.entries.find_by_description('nothing'), None)
+        self.assertEqual(self.ids(self.entries.find_by_project(10)), [2, 1])
+        self.assertEqual(self.ids(self.entries.find_by_project(None)), [3])
+        self.assertEqual(self.entries.now().get('id'), 4)
+        self.assertEqual(self.client.state.get()['entry']['id'], 4)
+
+    def test_add_in_order_of_start_time(self):
+        self.entries.add(self.new_entry(**entry_data(5, 'write', '10:30', pid=10)))
+        self.assertEqual(self.ids(self.entries.time_entries), [1, 2, 5, 3, 4])
+        self.assertEqual(self.ids(self.entries.find_all_by_description('write')), [4, 3, 5, 1])
+        self.assertEqual(self.ids(self.entries.find_by_project(10)), [5, 2, 1])
+        self.assertEqual(self.entries.find_by_id(5).get('start'), '2014-06-05T10:30:00+00:00')
+
+    def test_remove(self):
+        self.entries.remove(self.entries.find_by_id(4))
+        self.assertEqual(self.entries.find_by_id(4), None)
+        self.assertEqual(self.entries.find_by_description('write').get('id'), 3)
+        self.assertEqual(self.entries.find_by_project(20), [])
+        self.assertEqual(self.entries.now(), None)
+
+        self.entries.remove(self.entries.find_by_id(2))
+        self.assertEqual(self.entries.find_by_description('review'), None)
+        self.assertEqual(self.ids(self.entries.find_by_project(10)), [1])
+
+    def test_reload_rebuilds_indexes(self):
+        self.client.entries = [entry_data(7, 'plan', '08:00', pid=30)]
+        self.entries.reload()
+        self.assertEqual(self.ids(self.entries.time_entries), [7])
+        self.assertEqual(self.entries.find_by_id(1), None)
+        self.assertEqual(self.entries.find_by_description('write'), None)
+        self.assertEqual(self.ids(self.entries.find_by_project(30)), [7])
+        self.assertEqual(self.entries.now(), None)
+
+    def test_stopped_running_entry(self):
+        self.entries.find_by_id(4).set('duration', 3600)
+        self.assertEqual(self.entries.now(), None)
+
+    def test_entry_without_start_or_duration(self):
+        entry = self.new_entry(id=8, description='write')
+        self.entries.add(entry)
+        self.assertEqual(self.entries.time_entries[-1], entry)
+        self.assertEqual(self.entries.find_by_id(8), entry)
+        self.assertEqual(self.ids(self.entries.find_all_by_description('write')), [4, 3, 1])
+        self.assertEqual(self.entries.now().get('id'), 4)
+
+        self.entries.remove(entry)
+        self.assertEqual(self.entries.find_by_id(8), None)
+        self.assertEqual(len(self.entries.time_entries), 4)
+
+    def test_entry_without_id(self):
+        entry = self.new_entry(**entry_data(None, 'new', '13:00'))
+        entry.set('id', None)
+        self.entries.add(entry)
+        self.assertEqual(self.entries.find_by_description('new'), entry)
+        self.entries.remove(entry)
+        self.assertEqual(self.entries.find_by_description('new'), None)
+
+if __name__ == '__main__':
+    unittest.main()
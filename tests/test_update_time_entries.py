@@ -0,0 +1,94 @@
+"""
+Tests for pytoggl.toggl.update_time_entries(), against an in-memory
+stand-in for toggl.
+
+Run with: python -m unittest discover tests
+"""
+
+import json
+import threading
+import unittest
+
+from pytoggl.toggl import BULK_BATCH_SIZE, update_time_entries
+from pytoggl.utility import TogglHTTPError
+
+class FakeResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakeJournal(object):
+    """
+    Answers changes sent to /time_entries/{ids}. Entries not in entries
+    make the request fail with 404, and updates setting a pid not in
+    projects with 400.
+    """
+
+    def __init__(self, entries, projects):
+        self.entries = entries
+        self.projects = projects
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def send(self, method, path, data=None):
+        ids = [int(entry_id) for entry_id in path.rsplit('/', 1)[1].split(',')]
+        with self.lock:
+            self.requests.append((method, ids))
+        fields = json.loads(data)['time_entry']
+        if any(entry_id not in self.entries for entry_id in ids):
+            raise TogglHTTPError('not found', FakeResponse(404))
+        if fields.get('pid', self.projects[0]) not in self.projects:
+            raise TogglHTTPError('invalid pid', FakeResponse(400))
+        for entry_id in ids:
+            self.entries[entry_id].update(fields)
+        updated = [self.entries[entry_id] for entry_id in ids]
+        return {'data': updated if len(ids) > 1 else updated[0]}
+
+class FakeClient(object):
+
+    def __init__(self, journal):
+        self._journal = journal
+
+    def journal(self):
+        return self._journal
+
+class UpdateTimeEntriesTest(unittest.TestCase):
+
+    def setUp(self):
+        entries = dict((entry_id, {'id': entry_id, 'pid': 1}) for entry_id in range(1, 6))
+        self.journal = FakeJournal(entries, projects=[1, 2])
+        self.client = FakeClient(self.journal)
+
+    def test_batch(self):
+        result = update_time_entries([1, 2, 3], {'pid': 2}, client=self.client)
+        self.assertEqual(sorted(result.succeeded), [1, 2, 3])
+        self.assertEqual(result.failed, {})
+        self.assertEqual(self.journal.requests, [('put', [1, 2, 3])])
+        self.assertEqual([entry['pid'] for entry in result.entries], [2, 2, 2])
+
+    def test_batches_split(self):
+        ids = range(1, 6)
+        for entry_id in range(6, BULK_BATCH_SIZE + 3):
+            self.journal.entries[entry_id] = {'id': entry_id}
+            ids.append(entry_id)
+        result = update_time_entries(ids, {'pid': 2}, client=self.client)
+        self.assertEqual(len(result.succeeded), len(ids))
+        self.assertEqual([len(batch) for _, batch in self.journal.requests], [BULK_BATCH_SIZE, 2])
+
+    def test_missing_entry_falls_back_to_one_by_one(self):
+        result = update_time_entries([1, 2, 99, 3], {'pid': 2}, client=self.client)
+        self.assertEqual(sorted(result.succeeded), [1, 2, 3])
+        self.assertEqual(result.failed.keys(), [99])
+        self.assertEqual(result.failed[99].status_code, 404)
+        self.assertEqual(self.journal.requests[0], ('put', [1, 2, 99, 3]))
+        self.assertEqual(sorted(ids for _, ids in self.journal.requests[1:]), [[1], [2], [3], [99]])
+
+    def test_invalid_field_fails_batch_without_fallback(self):
+        result = update_time_entries([1, 2, 3], {'pid': 42}, client=self.client)
+        self.assertEqual(result.succeeded, [])
+        self.assertEqual(sorted(result.failed.keys()), [1, 2, 3])
+        self.assertEqual(result.failed[1].status_code, 400)
+        self.assertEqual(self.journal.requests, [('put', [1, 2, 3])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,9 +13,14 @@ import datetime
 import optparse
 import os
 import sys
+import threading
+import time
 
-from pytoggl.utility import Singleton, Config, DateAndTime, Logger
-from pytoggl.toggl import ClientList, ProjectList, TimeEntry, TimeEntryList, User
+from pytoggl import daemon
+from pytoggl.cache import DefaultCache
+from pytoggl.utility import Singleton, Config, DateAndTime, Logger, TogglError, VISIT_WWW_COMMAND
+from pytoggl.toggl import ClientList, DefaultClient, ProjectList, TimeEntry, TimeEntryList, User, \
+    current_time_entry, delete_time_entries
 
 VERBOSE = False # verbose output?
 Parser = None   # OptionParser initialized by main()
@@ -44,33 +49,7 @@ class CLI(object):
         options.
         """
 
-        # Override the option parser epilog formatting rule.
-        # See http://stackoverflow.com/questions/1857346/python-optparse-how-to-include-additional-info-in-usage-output
-        optparse.OptionParser.format_epilog = lambda self, formatter: self.epilog
-
-        self.parser = optparse.OptionParser(usage="Usage: %prog [OPTIONS] [ACTION]", \
-            epilog="\nActions:\n"
-            "  add DESCR [@PROJECT] START_DATETIME ('d'DURATION | END_DATETIME)\n\tcreates a completed time entry\n"
-            "  clients\n\tlists all clients\n"
-            "  continue DESCR\n\trestarts the given entry\n"
-            "  ls\n\tlist recent time entries\n"
-            "  now\n\tprint what you're working on now\n"
-            "  projects\n\tlists all projects\n"
-            "  rm ID\n\tdelete a time entry by id\n"
-            "  start DESCR [@PROJECT] [DATETIME]\n\tstarts a new entry\n"
-            "  stop [DATETIME]\n\tstops the current entry\n"
-            "  www\n\tvisits toggl.com\n"
-            "\n"
-            "  DURATION = [[Hours:]Minutes:]Seconds\n")
-        self.parser.add_option("-q", "--quiet",
-                              action="store_true", dest="quiet", default=False,
-                              help="don't print anything")
-        self.parser.add_option("-v", "--verbose",
-                              action="store_true", dest="verbose", default=False,
-                              help="print additional info")
-        self.parser.add_option("-d", "--debug",
-                              action="store_true", dest="debug", default=False,
-                              help="print debugging output")
+        self.parser = _option_parser()
 
         # self.args stores the remaining command line args.
         (options, self.args) = self.parser.parse_args()
@@ -84,6 +63,13 @@ class CLI(object):
         if options.verbose:
             global VERBOSE
             VERBOSE = True
+        self.workers = options.workers
+        self.profile = options.profile
+        self.profile_format = options.profile_format
+        if options.refresh:
+            DefaultCache().invalidate()
+            for cls in (ClientList, ProjectList, User):
+                cls.reset_instance()
 
     def _add_time_entry(self, args):
         """
@@ -96,7 +82,7 @@ class CLI(object):
 
         project_name = self._get_project_arg(args, optional=True)
         if project_name is not None:
-            project = ProjectList().find_by_name(project_name)
+            project = ProjectList().find_by_name(project_name, strict=True)
             if project == None:
                 raise RuntimeError("Project '%s' not found." % project_name)
 
@@ -133,10 +119,18 @@ class CLI(object):
             print ClientList()
         elif self.args[0] == "continue":
             self._continue_entry(self.args[1:])
+        elif self.args[0] == "daemon":
+            self._run_daemon(self.args[1:])
+        elif self.args[0] == "flush":
+            self._flush_journal()
+        elif self.args[0] == "import":
+            self._import_time_entries(self.args[1:])
         elif self.args[0] == "now":
             self._list_current_time_entry()
         elif self.args[0] == "projects":
             print ProjectList()
+        elif self.args[0] == "report":
+            self._print_report(self.args[1:])
         elif self.args[0] == "rm":
             self._delete_time_entry(self.args[1:])
         elif self.args[0] == "start":
@@ -166,19 +160,28 @@ class CLI(object):
 
     def _delete_time_entry(self, args):
         """
-        Removes a time entry from toggl.
-        args must be [ID] where ID is the unique identifier for the time
-        entry to be deleted.
+        Removes time entries from toggl.
+        args must be [ID ...] where each ID is the unique identifier of a
+        time entry to be deleted.
         """
         if len(args) == 0:
             CLI().print_help()
 
-        entry_id = args[0]
-
-        for entry in TimeEntryList():
-            if entry.get('id') == int(entry_id):
-                entry.delete()
-                Logger.info("Deleting entry " + entry_id)
+        ids = [arg for arg in args if arg.isdigit()]
+        for arg in args:
+            if not arg.isdigit():
+                Logger.info("'%s' is not a time entry id." % arg)
+        result = delete_time_entries(ids, workers=self.workers)
+        for entry_id in result.succeeded:
+            Logger.info("Deleting entry %s" % entry_id)
+        for entry_id, error in sorted(result.failed.items()):
+            Logger.info("Could not delete entry %s: %s" % (entry_id, error))
+
+    def _flush_journal(self):
+        """
+        Sends the time entry changes queued in the journal.
+        """
+        Logger.info(DefaultClient().journal().flush())
 
     def _get_datetime_arg(self, args, optional=False):
         """
@@ -240,17 +243,77 @@ class CLI(object):
         else:
             return args.pop(0)
 
+    def _import_time_entries(self, args):
+        """
+        Adds completed time entries from a CSV or JSONL file.
+        args should be: FILE
+        """
+        from pytoggl.bulk import import_entries, read_rows
+        path = self._get_str_arg(args, optional=False)
+
+        added = failed = 0
+        with open(path) as fileobj:
+            for result in import_entries(read_rows(fileobj), workers=self.workers):
+                if result.ok:
+                    added += 1
+                    Logger.debug(result)
+                else:
+                    failed += 1
+                    Logger.info(result)
+        Logger.info('%d added, %d failed' % (added, failed))
+
     def _list_current_time_entry(self):
         """
         Shows what the user is currently working on.
         """
-        entry = TimeEntryList().now()
+        entry = current_time_entry()
 
         if entry != None:
             Logger.info(str(entry))
         else:
             Logger.info("You're not working on anything right now.")
 
+    def _print_report(self, args):
+        """
+        Prints a report, totalled by toggl.
+        args should be: [summary | weekly | detailed] [SINCE [UNTIL]]
+        """
+        from pytoggl.reports import Reports
+        kind = self._get_str_arg(args, optional=True) or 'summary'
+        since = self._get_str_arg(args, optional=True)
+        until = self._get_str_arg(args, optional=True)
+
+        if kind == 'summary':
+            print Reports().summary(since, until)
+        elif kind == 'weekly':
+            print Reports().weekly(since)
+        elif kind == 'detailed':
+            print Reports().detailed(since, until)
+        else:
+            self.print_help()
+
+    def _run_daemon(self, args):
+        """
+        Serves commands from other toggl-cli.py processes until stopped.
+        args should be: [stop]
+        """
+        if self._get_str_arg(args, optional=True) == 'stop':
+            if not daemon.stop():
+                Logger.info("No daemon is running.")
+            return
+
+        def ready():
+            flusher = threading.Thread(target=_flush_periodically)
+            flusher.daemon = True
+            flusher.start()
+            Logger.info("Serving on %s" % daemon.socket_path())
+
+        try:
+            daemon.Daemon(_daemon_command).serve_forever(on_ready=ready)
+        except RuntimeError, e:
+            print e
+            sys.exit(1)
+
     def print_help(self):
         """Prints the usage message and exits."""
         self.parser.print_help()
@@ -282,7 +345,9 @@ class CLI(object):
         args contains an optional end time.
         """
 
-        entry = TimeEntryList().now()
+        # Ask toggl rather than trusting the local state, which may be
+        # stale if the entry was stopped or another started elsewhere.
+        entry = current_time_entry(max_age=0)
         if entry != None:
             if len(args) > 0:
                 entry.stop(DateAndTime().parse_local_datetime_str(args[0]))
@@ -295,6 +360,137 @@ class CLI(object):
         else:
             Logger.info("You're not working on anything right now.")
 
+#----------------------------------------------------------------------------
+# Entry points
+#----------------------------------------------------------------------------
+METADATA_LOADED_AT = time.time()
+FLUSH_INTERVAL = 5 # seconds between the daemon's journal flushes
+
+def run(args):
+    """
+    Performs the command line given by args (without the program name) and
+    returns the exit status. Resets the state left by any previous command,
+    so a daemon can call it repeatedly.
+    """
+    global VERBOSE
+    VERBOSE = False
+    sys.argv = sys.argv[:1] + args
+    CLI.reset_instance()
+    TimeEntryList.reset_instance()
+    metrics = None
+    try:
+        cli = CLI()
+        if cli.profile:
+            from pytoggl.metrics import RequestMetrics
+            metrics = RequestMetrics().install()
+        cli.act()
+    except TogglError, e:
+        print e
+        return 1
+    finally:
+        if metrics is not None:
+            metrics.uninstall()
+            _print_profile(metrics, cli.profile_format)
+    return 0
+
+def _daemon_command(args):
+    # The daemon keeps user, client and project data between commands, but
+    # refetches it once the metadata cache would have expired.
+    global METADATA_LOADED_AT
+    if time.time() - METADATA_LOADED_AT >= DefaultCache().ttl:
+        for cls in (ClientList, ProjectList, User):
+            cls.reset_instance()
+        METADATA_LOADED_AT = time.time()
+    return run(args)
+
+def _option_parser():
+    """
+    Returns the OptionParser for the command line.
+    """
+    # Override the option parser epilog formatting rule.
+    # See http://stackoverflow.com/questions/1857346/python-optparse-how-to-include-additional-info-in-usage-output
+    optparse.OptionParser.format_epilog = lambda self, formatter: self.epilog
+
+    parser = optparse.OptionParser(usage="Usage: %prog [OPTIONS] [ACTION]", \
+        epilog="\nActions:\n"
+        "  add DESCR [@PROJECT] START_DATETIME ('d'DURATION | END_DATETIME)\n\tcreates a completed time entry\n"
+        "  clients\n\tlists all clients\n"
+        "  continue DESCR\n\trestarts the given entry\n"
+        "  daemon [stop]\n\truns (or stops) a background server that speeds up later commands\n"
+        "  flush\n\tsends changes queued while toggl was unreachable\n"
+        "  import FILE\n\tadds completed time entries from a CSV or JSONL file\n"
+        "  ls\n\tlist recent time entries\n"
+        "  now\n\tprint what you're working on now\n"
+        "  projects\n\tlists all projects\n"
+        "  report [summary | weekly | detailed] [SINCE [UNTIL]]\n\tprints a report; dates are YYYY-MM-DD\n"
+        "  rm ID [ID ...]\n\tdelete time entries by id\n"
+        "  start DESCR [@PROJECT] [DATETIME]\n\tstarts a new entry\n"
+        "  stop [DATETIME]\n\tstops the current entry\n"
+        "  www\n\tvisits toggl.com\n"
+        "\n"
+        "  DURATION = [[Hours:]Minutes:]Seconds\n")
+    parser.add_option("-q", "--quiet",
+                      action="store_true", dest="quiet", default=False,
+                      help="don't print anything")
+    parser.add_option("-v", "--verbose",
+                      action="store_true", dest="verbose", default=False,
+                      help="print additional info")
+    parser.add_option("-d", "--debug",
+                      action="store_true", dest="debug", default=False,
+                      help="print debugging output")
+    parser.add_option("-r", "--refresh",
+                      action="store_true", dest="refresh", default=False,
+                      help="refetch cached user, client and project data")
+    parser.add_option("-w", "--workers",
+                      type="int", dest="workers", default=8,
+                      help="number of concurrent requests for import and rm")
+    parser.add_option("--profile",
+                      action="store_true", dest="profile", default=False,
+                      help="print statistics of the requests made to toggl")
+    parser.add_option("--profile-format",
+                      type="choice", choices=["text", "json", "prometheus"],
+                      dest="profile_format", default="text",
+                      help="format of the --profile statistics: text, json or prometheus")
+    return parser
+
+def _action(args):
+    """
+    Returns the action in the given command line, as CLI() sees it after
+    parsing the options, or None.
+    """
+    _, positional = _option_parser().parse_args(args)
+    return positional[0] if positional else None
+
+def _print_profile(metrics, profile_format):
+    # Printed to stderr, so the command's own output can still be piped.
+    if profile_format == 'json':
+        output = metrics.to_json() + "\n"
+    elif profile_format == 'prometheus':
+        output = metrics.to_prometheus()
+    else:
+        output = "\n" + metrics.summary() + "\n"
+    sys.stderr.write(output)
+
+def _flush_periodically():
+    # Runs in the daemon, sending changes queued by commands (see the
+    # queue_writes option) without making the commands wait for toggl.
+    journal = DefaultClient().journal()
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        # Errors are logged rather than raised, which would end the thread
+        # and leave queued changes unsent for the daemon's lifetime.
+        try:
+            if journal.pending():
+                journal.flush()
+        except TogglError, e:
+            Logger.debug("Flush failed: %s" % e)
+        except Exception, e:
+            Logger.info("Flush failed: %r" % e)
+
 if __name__ == "__main__":
-    CLI().act()
-    sys.exit(0)
+    args = sys.argv[1:]
+    if _action(args) != 'daemon':
+        status = daemon.call(args)
+        if status is not None:
+            sys.exit(status)
+    sys.exit(run(args))